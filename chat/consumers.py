@@ -4,7 +4,8 @@ from openai import AsyncOpenAI
 from django.conf import settings
 from channels.db import database_sync_to_async
 from .models import ChatMessage
-from scans.models import FaceScan, UserGoal
+from scans.models import UserGoal
+from scans.services import get_scan_aggregate
 from payments.services import verify_subscription_status
 from .prompts import FACECOACH_KNOWLEDGE_BASE
 
@@ -121,11 +122,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
     @database_sync_to_async
     def get_user_context(self):
-        scan = FaceScan.objects.filter(user=self.user).last()
+        scan = get_scan_aggregate(self.user.id).latest()
         goal = UserGoal.objects.filter(user=self.user).first()
         context = ""
         if scan:
-            context += f"Jaw:{scan.jawline_angle},Sym:{scan.symmetry_score}%. "
+            context += f"Jaw:{scan['jawline_angle']},Sym:{scan['symmetry_score']}%. "
         if goal:
             context += f"GoalJaw:{goal.target_jawline}. "
         return context
\ No newline at end of file
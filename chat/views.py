@@ -3,7 +3,8 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from django.conf import settings
-from scans.models import FaceScan, UserGoal
+from scans.models import UserGoal
+from scans.services import get_scan_aggregate
 from openai import OpenAI
 from .models import ChatMessage
 from .serializers import ChatMessageSerializer
@@ -31,12 +32,12 @@ class ChatCoachView(APIView):
 
         ChatMessage.objects.create(user=request.user, sender='USER', message=user_message)
 
-        scan = FaceScan.objects.filter(user=request.user).last()
+        scan = get_scan_aggregate(request.user.id).latest()
         goal = UserGoal.objects.filter(user=request.user).first()
         
         context_str = "User Data: "
         if scan:
-            context_str += f"Jawline Angle: {scan.jawline_angle}, Symmetry: {scan.symmetry_score}%, Puffiness: {scan.puffiness_index}. "
+            context_str += f"Jawline Angle: {scan['jawline_angle']}, Symmetry: {scan['symmetry_score']}%, Puffiness: {scan['puffiness_index']}. "
         if goal:
             context_str += f"Targets: Jaw {goal.target_jawline}, Sym {goal.target_symmetry}. "
 
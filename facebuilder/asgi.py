@@ -1,15 +1,47 @@
 import os
+import logging
+import threading
 import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'facebuilder.settings')
 django.setup()
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
+from asgiref.sync import sync_to_async
 from channels.routing import ProtocolTypeRouter, URLRouter
 from facebuilder.middleware import JwtAuthMiddleware
 from chat.routing import websocket_urlpatterns
+from scans.services import warm_up_web_process
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up():
+    try:
+        warm_up_web_process()
+    except Exception as e:
+        logger.warning(f"Scan engine warm-up failed: {e}")
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await sync_to_async(warm_up, thread_sensitive=False)()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+# Daphne never sends lifespan events, so warm up in the background as well;
+# warm_up_web_process only runs once per process.
+if settings.SCAN_WARM_UP:
+    threading.Thread(target=warm_up, name='scan-warm-up', daemon=True).start()
 
 application = ProtocolTypeRouter({
+    "lifespan": lifespan,
     "http": get_asgi_application(),
     "websocket": JwtAuthMiddleware(
         URLRouter(
@@ -0,0 +1,67 @@
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from scans import telemetry
+
+
+def user_version_key(user_id):
+    return f"user_cache_version:{user_id}"
+
+
+def user_cache_version(user_id):
+    key = user_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so an evicted counter never restarts at a version that still has entries.
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_user_cache_versions(user_ids):
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+
+    def bump():
+        for user_id in user_ids:
+            try:
+                cache.incr(user_version_key(user_id))
+            except ValueError:
+                cache.add(user_version_key(user_id), time.time_ns(), timeout=None)
+
+    # Bumping after commit keeps a concurrent read from caching the old rows under the new version.
+    transaction.on_commit(bump)
+
+
+def bump_user_cache_version(user_id):
+    bump_user_cache_versions([user_id])
+
+
+def user_cache_key(user_id, name):
+    return f"user_cache:{user_id}:{user_cache_version(user_id)}:{name}"
+
+
+def cache_user_response(name, timeout=None):
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(view, request, *args, **kwargs):
+            key = user_cache_key(request.user.pk, name)
+            data = cache.get(key)
+            if data is not None:
+                telemetry.increment('user_cache_requests', view=name, result='hit')
+                return Response(data, status=status.HTTP_200_OK)
+
+            telemetry.increment('user_cache_requests', view=name, result='miss')
+            response = view_method(view, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(key, response.data, timeout=timeout or settings.USER_CACHE_TTL)
+            return response
+        return wrapper
+    return decorator
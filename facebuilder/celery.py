@@ -1,6 +1,7 @@
 from __future__ import absolute_import, unicode_literals
 import os
 from celery import Celery
+from celery.signals import celeryd_init, worker_process_init
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'facebuilder.settings')
 
@@ -10,6 +11,26 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 
 app.autodiscover_tasks()
 
+# Queues this worker consumes; recorded in the parent and inherited by its prefork children.
+worker_queues = set()
+
+@celeryd_init.connect
+def size_scan_worker(conf=None, options=None, **kwargs):
+    from django.conf import settings
+    options = options or {}
+    worker_queues.update(options.get('queues') or [])
+    # The scan worker runs one child per calibrated slot unless -c is given explicitly.
+    if settings.SCAN_QUEUE in (options.get('queues') or []) and not options.get('concurrency'):
+        conf.worker_concurrency = settings.SCAN_POOL_PROCESSES
+
+@worker_process_init.connect
+def warm_scan_engine(**kwargs):
+    from django.conf import settings
+    # Only workers that consume scans need the cv2 and MediaPipe engines.
+    if settings.SCAN_WARM_UP and settings.SCAN_QUEUE in worker_queues:
+        from scans.ai_logic import warm_up
+        warm_up()
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
\ No newline at end of file
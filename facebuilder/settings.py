@@ -1,9 +1,11 @@
+import json
 import os
 from pathlib import Path
 from dotenv import load_dotenv
 import dj_database_url
 from datetime import timedelta
 from corsheaders.defaults import default_headers
+from celery.schedules import crontab
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -122,6 +124,7 @@ REST_FRAMEWORK = {
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/hour',
         'otp': '5/minute',
+        'preflight': os.getenv('SCAN_PREFLIGHT_RATE', '10/second'),
     },
 }
 
@@ -154,6 +157,80 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+CELERY_TASK_ROUTES = {
+    'scans.tasks.process_face_scan': {'queue': 'cv'},
+    'scans.tasks.process_face_scans_batch': {'queue': 'cv'},
+}
+# Redis emulates priorities with one list per step; lower numbers are served first.
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': [0, 3, 6, 9],
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
+CELERY_BEAT_SCHEDULE = {
+    'dispatch-pending-scans': {
+        'task': 'scans.tasks.dispatch_pending_scans',
+        'schedule': float(os.getenv('SCAN_DISPATCH_INTERVAL', '10')),
+    },
+    'record-scan-queue-depths': {
+        'task': 'scans.tasks.record_scan_queue_depths',
+        'schedule': float(os.getenv('SCAN_QUEUE_METRICS_INTERVAL', '15')),
+    },
+    'close-lapsed-streaks': {
+        'task': 'workouts.tasks.close_lapsed_streaks',
+        'schedule': crontab(hour=0, minute=30),
+    },
+}
+
+FACE_MESH_POOL_SIZE = int(os.getenv('FACE_MESH_POOL_SIZE', '2'))
+FACE_MESH_POOL_TIMEOUT = float(os.getenv('FACE_MESH_POOL_TIMEOUT', '30'))
+SCAN_PROCESSING_MODE = os.getenv('SCAN_PROCESSING_MODE', 'sync').lower()
+SCAN_MAX_DIMENSION = int(os.getenv('SCAN_MAX_DIMENSION', '1280'))
+SCAN_MAX_UPLOAD_BYTES = int(os.getenv('SCAN_MAX_UPLOAD_MB', '20')) * 1024 * 1024
+SCAN_WORKER_MEMORY_LIMIT = int(os.getenv('SCAN_WORKER_MEMORY_LIMIT_MB', '512')) * 1024 * 1024
+SCAN_MEMORY_WAIT_TIMEOUT = float(os.getenv('SCAN_MEMORY_WAIT_TIMEOUT', '30'))
+SCAN_RESULT_CACHE_TTL = int(os.getenv('SCAN_RESULT_CACHE_TTL', str(60 * 60 * 24 * 7)))
+# Written by `manage.py calibrate_scan_engine`; environment variables still take precedence.
+SCAN_ENGINE_CONFIG = os.getenv('SCAN_ENGINE_CONFIG', os.path.join(BASE_DIR, 'scan_engine.json'))
+SCAN_ENGINE_CALIBRATION = {}
+if os.path.exists(SCAN_ENGINE_CONFIG):
+    with open(SCAN_ENGINE_CONFIG) as f:
+        SCAN_ENGINE_CALIBRATION = json.load(f).get('settings', {})
+SCAN_POOL_PROCESSES = int(os.getenv('SCAN_POOL_PROCESSES', SCAN_ENGINE_CALIBRATION.get('SCAN_POOL_PROCESSES', 2)))
+# -1 keeps OpenCV's default; 0 keeps MediaPipe's (one XNNPACK thread per graph on Linux).
+SCAN_OPENCV_THREADS = int(os.getenv('SCAN_OPENCV_THREADS', SCAN_ENGINE_CALIBRATION.get('SCAN_OPENCV_THREADS', -1)))
+SCAN_INFERENCE_THREADS = int(os.getenv('SCAN_INFERENCE_THREADS', SCAN_ENGINE_CALIBRATION.get('SCAN_INFERENCE_THREADS', 0)))
+SCAN_POOL_MAX_TASKS_PER_CHILD = int(os.getenv('SCAN_POOL_MAX_TASKS_PER_CHILD', '200'))
+SCAN_POOL_QUEUE_LIMIT = int(os.getenv('SCAN_POOL_QUEUE_LIMIT', '8'))
+# memory (per process), prometheus (aggregated in Redis), statsd or none
+SCAN_METRICS_SINK = os.getenv('SCAN_METRICS_SINK', 'memory').lower()
+SCAN_METRICS_TOKEN = os.getenv('SCAN_METRICS_TOKEN', '')
+STATSD_HOST = os.getenv('STATSD_HOST', '127.0.0.1')
+STATSD_PORT = int(os.getenv('STATSD_PORT', '8125'))
+STATSD_PREFIX = os.getenv('STATSD_PREFIX', 'facebuilder')
+FACE_DETECTION_POOL_SIZE = int(os.getenv('FACE_DETECTION_POOL_SIZE', '4'))
+SCAN_PREFLIGHT_MAX_DIMENSION = int(os.getenv('SCAN_PREFLIGHT_MAX_DIMENSION', '320'))
+SCAN_PREFLIGHT_MAX_UPLOAD_BYTES = int(os.getenv('SCAN_PREFLIGHT_MAX_UPLOAD_KB', '1024')) * 1024
+SCAN_BURST_MAX_FRAMES = int(os.getenv('SCAN_BURST_MAX_FRAMES', '15'))
+SCAN_BURST_MIN_FRAMES = int(os.getenv('SCAN_BURST_MIN_FRAMES', '3'))
+SCAN_BATCH_SIZE = int(os.getenv('SCAN_BATCH_SIZE', '50'))
+SCAN_DISPATCH_MAX_BATCHES = int(os.getenv('SCAN_DISPATCH_MAX_BATCHES', '20'))
+# Queued or processing scans untouched for this long lost their message or worker and are dispatched again.
+SCAN_STALE_AFTER = int(os.getenv('SCAN_STALE_AFTER', str(30 * 60)))
+SCAN_QUEUE = 'cv'
+SCAN_LANE_PRIORITIES = {
+    'premium': int(os.getenv('SCAN_PRIORITY_PREMIUM', '0')),
+    'free': int(os.getenv('SCAN_PRIORITY_FREE', '6')),
+}
+SCAN_WARM_UP = os.getenv('SCAN_WARM_UP', 'True').lower() == 'true'
+SCAN_TIMESERIES_DEFAULT_POINTS = int(os.getenv('SCAN_TIMESERIES_DEFAULT_POINTS', '120'))
+SCAN_TIMESERIES_MAX_POINTS = int(os.getenv('SCAN_TIMESERIES_MAX_POINTS', '1000'))
+SCAN_TIMESERIES_MAX_DAYS = int(os.getenv('SCAN_TIMESERIES_MAX_DAYS', '3650'))
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', str(60 * 60)))
+LEADERBOARD_WINDOW = int(os.getenv('LEADERBOARD_WINDOW', '2'))
+PLAN_CACHE_TTL = int(os.getenv('PLAN_CACHE_TTL', str(60 * 60 * 24 * 7)))
+DASHBOARD_GRAPH_SCANS = int(os.getenv('DASHBOARD_GRAPH_SCANS', '30'))
+DASHBOARD_CACHE_TTL = int(os.getenv('DASHBOARD_CACHE_TTL', str(60 * 60 * 24)))
 
 CORS_ALLOW_ALL_ORIGINS = DEBUG
 if not CORS_ALLOW_ALL_ORIGINS:
@@ -8,6 +8,7 @@ from datetime import datetime
 from django.utils.decorators import method_decorator 
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
+from facebuilder.cache import bump_user_cache_version
 from .services import manual_sync_revenuecat, verify_subscription_status
 
 User = get_user_model()
@@ -81,6 +82,7 @@ class RevenueCatWebhookView(APIView):
             elif event_type in ['CANCELLATION', 'EXPIRATION', 'billing_issue']:
                 Subscription.objects.filter(user=user).update(is_active=False)
 
+            bump_user_cache_version(user.pk)
             return Response({"message": "Webhook processed"}, status=status.HTTP_200_OK)
 
         except User.DoesNotExist:
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import FaceScan, UserGoal
+from .models import FaceScan, ScanAggregate, UserGoal
 
 @admin.register(FaceScan)
 class FaceScanAdmin(admin.ModelAdmin):
@@ -8,6 +8,12 @@ class FaceScanAdmin(admin.ModelAdmin):
     search_fields = ('user__phone_number', 'user__name')
     readonly_fields = ('created_at',)
 
+@admin.register(ScanAggregate)
+class ScanAggregateAdmin(admin.ModelAdmin):
+    list_display = ('user', 'scan_count', 'last_jawline_angle', 'last_symmetry_score', 'last_scan_at')
+    search_fields = ('user__phone_number',)
+    readonly_fields = ('updated_at',)
+
 @admin.register(UserGoal)
 class UserGoalAdmin(admin.ModelAdmin):
     list_display = ('user', 'target_jawline', 'target_symmetry', 'target_puffiness', 'updated_at')
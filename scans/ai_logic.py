@@ -1,125 +1,387 @@
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
 import cv2
-import mediapipe as mp
 import numpy as np
+from django.conf import settings
+from PIL import ImageFile
+from .engine import face_detection_pool, face_mesh_pool, tracking_mesh_pool
+from .ingest import open_scan_buffer, open_scan_source, scan_memory_budget
+from . import telemetry
+from .metrics import (
+    METRIC_DIGITS, METRIC_FIELDS, MULTI_FACE_MIN_WIDTH, ScanRejected, compute_face_metrics, detection_rejection,
+    landmarks_to_array, map_roi_landmarks, pack_landmarks, rejection_code, roi_bounds
+)
+
+# Prefork workers each get their own thread pool; the default of one per core oversubscribes the host.
+cv2.setNumThreads(settings.SCAN_OPENCV_THREADS)
 
 MIN_BRIGHTNESS = 60
 MIN_VARIANCE = 50
+PROBE_CHUNK_SIZE = 64 * 1024
+WARM_UP_SIZE = 192
+MAD_SCALE = 1.4826
 
-def calculate_angle(a, b, c):
-    ba = np.array(a) - np.array(b)
-    bc = np.array(c) - np.array(b)
-    
-    denom = np.linalg.norm(ba) * np.linalg.norm(bc)
-    if denom == 0:
-        return 0.0
-        
-    cosine_angle = np.dot(ba, bc) / denom
-    angle = np.arccos(np.clip(cosine_angle, -1.0, 1.0))
-    return np.degrees(angle)
-
-def get_distance(p1, p2):
-    return np.linalg.norm(np.array(p1) - np.array(p2))
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
 
-def analyze_face_image(image_file):
-    file_bytes = np.asarray(bytearray(image_file.read()), dtype=np.uint8)
-    image = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-    
+ANALYSIS_STAGES = ('decode', 'brightness', 'blur', 'face_detect', 'face_mesh', 'metrics')
+
+_stage_listeners = ContextVar('scan_stage_listeners', default=())
+
+@contextmanager
+def stage_listener(listener):
+    token = _stage_listeners.set(_stage_listeners.get() + (listener,))
+    try:
+        yield
+    finally:
+        _stage_listeners.reset(token)
+
+@contextmanager
+def timed_stage(name):
+    listeners = _stage_listeners.get()
+    if not listeners:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        for listener in listeners:
+            listener(name, elapsed)
+
+def probe_image_size(file_bytes):
+    parser = ImageFile.Parser()
+    view = memoryview(file_bytes)
+    try:
+        for offset in range(0, len(view), PROBE_CHUNK_SIZE):
+            parser.feed(view[offset:offset + PROBE_CHUNK_SIZE].tobytes())
+            if parser.image is not None:
+                return parser.image.size
+    except Exception:
+        return None
+    return None
+
+def decode_plan(header_size, max_dimension):
+    if header_size:
+        for factor, reduced_flag in REDUCED_DECODE_FLAGS:
+            if max(header_size) // factor >= max_dimension:
+                return factor, reduced_flag
+    return 1, cv2.IMREAD_COLOR
+
+def estimate_decoded_bytes(size, max_dimension, factor=1):
+    width, height = size
+    decoded_pixels = (width // factor + 1) * (height // factor + 1)
+    scale = min(1.0, max_dimension / max(width // factor, height // factor, 1))
+    working_pixels = decoded_pixels * scale * scale
+    # Decoded BGR, resized BGR, RGB copy, grayscale and the float64 Laplacian.
+    return int(decoded_pixels * 3 + working_pixels * (3 + 3 + 1 + 8))
+
+def estimate_working_bytes(file_bytes, header_size, max_dimension):
+    if not header_size:
+        return file_bytes.nbytes * 10
+
+    factor, _ = decode_plan(header_size, max_dimension)
+    return file_bytes.nbytes + estimate_decoded_bytes(header_size, max_dimension, factor)
+
+def decode_scan_image(file_bytes, max_dimension=None, header_size=None):
+    max_dimension = max_dimension or settings.SCAN_MAX_DIMENSION
+    if header_size is None:
+        header_size = probe_image_size(file_bytes)
+
+    _, flag = decode_plan(header_size, max_dimension)
+
+    image = cv2.imdecode(file_bytes, flag)
     if image is None:
-        raise ValueError("Could not decode image")
+        raise ScanRejected('undecodable')
+
+    height, width = image.shape[:2]
+    original_size = (width, height)
+    if flag != cv2.IMREAD_COLOR:
+        original_width, original_height = header_size
+        # The decoder applies EXIF orientation, the header size does not.
+        if (original_width > original_height) != (width > height):
+            original_width, original_height = original_height, original_width
+        original_size = (original_width, original_height)
+
+    return resize_to_fit(image, max_dimension), original_size
+
+def resize_to_fit(image, max_dimension, interpolation=cv2.INTER_AREA):
+    height, width = image.shape[:2]
+    longest = max(width, height)
+    if longest <= max_dimension:
+        return image
+
+    scale = max_dimension / longest
+    return cv2.resize(
+        image,
+        (max(1, round(width * scale)), max(1, round(height * scale))),
+        interpolation=interpolation
+    )
+
+def read_video_frames(path, max_frames, max_dimension=None):
+    max_dimension = max_dimension or settings.SCAN_MAX_DIMENSION
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ScanRejected('undecodable')
+
+    try:
+        # Spread the sampled frames over the clip; grab() skips decoding the rest.
+        frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        step = max(1, frame_count // max_frames) if frame_count > 0 else 1
+        frame_size = (int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        frame_bytes = estimate_decoded_bytes(frame_size, max_dimension)
+        index = 0
+        yielded = 0
+        while yielded < max_frames and capture.grab():
+            if index % step == 0:
+                with scan_memory_budget().reserve(frame_bytes):
+                    ok, frame = capture.retrieve()
+                    if ok:
+                        height, width = frame.shape[:2]
+                        yield resize_to_fit(frame, max_dimension), (width, height)
+                        yielded += 1
+            index += 1
+    finally:
+        capture.release()
+
+def decode_burst_frames(sources, max_dimension=None):
+    max_dimension = max_dimension or settings.SCAN_MAX_DIMENSION
+    for source in sources:
+        # Each frame is mapped and decoded only when reached, and holds its reservation until the next one.
+        try:
+            with open_scan_source(source) as file_bytes:
+                header_size = probe_image_size(file_bytes)
+                with scan_memory_budget().reserve(estimate_working_bytes(file_bytes, header_size, max_dimension)):
+                    try:
+                        frame = decode_scan_image(file_bytes, max_dimension, header_size)
+                    except (ScanRejected, cv2.error):
+                        frame = None, None
+                    yield frame
+        except ScanRejected:
+            yield None, None
+
+def warm_up():
+    # One inference per engine so graph setup and delegate init happen before the first scan.
+    blank = np.zeros((WARM_UP_SIZE, WARM_UP_SIZE, 3), dtype=np.uint8)
+    face_mesh_pool().warm(lambda face_mesh: face_mesh.process(blank))
+    warm_up_preflight()
+
+def warm_up_preflight():
+    blank = np.zeros((WARM_UP_SIZE, WARM_UP_SIZE, 3), dtype=np.uint8)
+    face_detection_pool().warm(lambda detector: detector.process(blank))
+
+def analyze_face_image(image_file):
+    with open_scan_buffer(image_file) as file_bytes:
+        return analyze_image_buffer(file_bytes)
+
+def analyze_image_buffer(file_bytes):
+    stages = {}
+
+    def record(stage, elapsed):
+        stages[stage] = stages.get(stage, 0) + elapsed
+
+    outcome = 'error'
+    started = time.perf_counter()
+    try:
+        with stage_listener(record):
+            result = _analyze_buffer(file_bytes)
+        outcome = 'ok'
+        return result
+    except ValueError as e:
+        outcome = rejection_code(e)
+        raise
+    finally:
+        record_analysis(outcome, time.perf_counter() - started, stages)
+
+def record_analysis(outcome, elapsed, stages):
+    # Stage timings are only labelled once the outcome is known, so a blur
+    # rejection's decode time is not mixed in with successful scans.
+    telemetry.observe('scan_analysis_seconds', elapsed, outcome=outcome)
+    for stage, stage_elapsed in stages.items():
+        telemetry.observe('scan_stage_seconds', stage_elapsed, stage=stage, outcome=outcome)
 
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    
-    brightness = cv2.mean(gray)[0]
+def _analyze_buffer(file_bytes):
+    max_dimension = settings.SCAN_MAX_DIMENSION
+    header_size = probe_image_size(file_bytes)
+
+    with scan_memory_budget().reserve(estimate_working_bytes(file_bytes, header_size, max_dimension)):
+        return _analyze_decoded(file_bytes, max_dimension, header_size)
+
+def _analyze_decoded(file_bytes, max_dimension, header_size):
+    with timed_stage('decode'):
+        image, (width, height) = decode_scan_image(file_bytes, max_dimension, header_size)
+
+    check_image_quality(image)
+
+    # The detector works on a small copy; its box is relative, so it applies to the full image.
+    with timed_stage('face_detect'):
+        small = resize_to_fit(image, settings.SCAN_PREFLIGHT_MAX_DIMENSION, cv2.INTER_LINEAR)
+        detection = detect_single_face(cv2.cvtColor(small, cv2.COLOR_BGR2RGB))
+        roi = roi_bounds(detection_box(detection), image.shape[1], image.shape[0])
+
+    with timed_stage('face_mesh'):
+        left, top, right, bottom = roi
+        rgb_crop = cv2.cvtColor(image[top:bottom, left:right], cv2.COLOR_BGR2RGB)
+        with face_mesh_pool().checkout() as face_mesh:
+            results = face_mesh.process(rgb_crop)
+
+    if not results.multi_face_landmarks:
+        raise ScanRejected('no_face')
+
+    with timed_stage('metrics'):
+        points = map_roi_landmarks(
+            landmarks_to_array(results.multi_face_landmarks[0].landmark), roi, image.shape[1], image.shape[0]
+        )
+        metrics = compute_face_metrics(points, width, height)
+
+    if metrics['rejection']:
+        raise ScanRejected(metrics['rejection'])
+
+    result = {field: metrics[field] for field in METRIC_FIELDS}
+    result.update(landmarks=pack_landmarks(points), image_width=width, image_height=height)
+    return result
+
+def detection_box(detection):
+    box = detection.location_data.relative_bounding_box
+    return box.xmin, box.ymin, box.width, box.height
+
+def detect_single_face(rgb_image):
+    with face_detection_pool().checkout() as detector:
+        results = detector.process(rgb_image)
+
+    if not results.detections:
+        raise ScanRejected('no_face')
+
+    faces = [d for d in results.detections if detection_box(d)[2] >= MULTI_FACE_MIN_WIDTH]
+    if len(faces) > 1:
+        raise ScanRejected('multiple_faces')
+    return max(faces or results.detections, key=lambda d: d.score[0])
+
+def check_image_quality(image):
+    with timed_stage('brightness'):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        brightness = cv2.mean(gray)[0]
     if brightness < MIN_BRIGHTNESS:
-        raise ValueError("Lighting is too dark. Please face a light source.")
+        raise ScanRejected('too_dark')
 
-    variance = cv2.Laplacian(gray, cv2.CV_64F).var()
+    with timed_stage('blur'):
+        variance = cv2.Laplacian(gray, cv2.CV_64F).var()
     if variance < MIN_VARIANCE:
-        raise ValueError("Image is too blurry. Please hold the camera steady.")
-
-    height, width, _ = image.shape
-    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    
-    mp_face_mesh = mp.solutions.face_mesh
-    
-    with mp_face_mesh.FaceMesh(
-        static_image_mode=True,
-        max_num_faces=1,
-        refine_landmarks=True,
-        min_detection_confidence=0.5
-    ) as face_mesh:
-        
-        results = face_mesh.process(rgb_image)
-        
-        if not results.multi_face_landmarks:
-            raise ValueError("No face detected. Please ensure your face is clearly visible.")
-            
-        landmarks = results.multi_face_landmarks[0].landmark
-
-        nose_tip = landmarks[1].x
-        left_cheek_outer = landmarks[234].x
-        right_cheek_outer = landmarks[454].x
-
-        left_dist = abs(nose_tip - left_cheek_outer)
-        right_dist = abs(nose_tip - right_cheek_outer)
-        
-        if right_dist > 0:
-            ratio = left_dist / right_dist
-            if ratio < 0.5 or ratio > 2.0:
-                raise ValueError("Please look straight at the camera.")
-
-        left_eye_y = landmarks[33].y
-        right_eye_y = landmarks[263].y
-        
-        eye_slope = abs(left_eye_y - right_eye_y)
-        if eye_slope > 0.1:
-            raise ValueError("Please keep your head level.")
-
-        x_values = [lm.x for lm in landmarks]
-        y_values = [lm.y for lm in landmarks]
-
-        min_x, max_x = min(x_values), max(x_values)
-        min_y, max_y = min(y_values), max(y_values)
-
-        face_width_ratio = max_x - min_x
-
-        if min_x < 0.01 or max_x > 0.99 or min_y < 0.01 or max_y > 0.99:
-             raise ValueError("You are too close to the camera.")
-
-        if face_width_ratio < 0.20:
-            raise ValueError("You are too far from the camera.")
-
-        def get_coords(index):
-            return (landmarks[index].x * width, landmarks[index].y * height)
-
-        left_jaw_angle = calculate_angle(get_coords(177), get_coords(172), get_coords(152))
-        right_jaw_angle = calculate_angle(get_coords(401), get_coords(397), get_coords(152))
-        final_jawline = (left_jaw_angle + right_jaw_angle) / 2
-        
-        pairs = [(33, 263), (133, 362), (61, 291), (234, 454), (172, 397)]
-        
-        total_deviation = 0
-        mid_x = get_coords(168)[0] 
-        
-        for left_idx, right_idx in pairs:
-            l_x, _ = get_coords(left_idx)
-            r_x, _ = get_coords(right_idx)
-            l_dist = abs(mid_x - l_x)
-            r_dist = abs(r_x - mid_x)
-            denominator = (l_dist + r_dist) / 2
-            if denominator > 0:
-                diff = abs(l_dist - r_dist) / denominator
-                total_deviation += diff
-
-        avg_deviation = total_deviation / len(pairs)
-        symmetry_score = max(10, 100 - (avg_deviation * 50))
-        cheek_width = get_distance(get_coords(234), get_coords(454))
-        jaw_width = get_distance(get_coords(172), get_coords(397))
-        puffiness_index = cheek_width / jaw_width if jaw_width > 0 else 1.0
-        normalized_puffiness = (puffiness_index - 1.0)
-
-        return {
-            "jawline_angle": round(final_jawline, 1),
-            "symmetry_score": round(symmetry_score, 1),
-            "puffiness_index": round(max(0.1, normalized_puffiness), 2)
-        }
\ No newline at end of file
+        raise ScanRejected('too_blurry')
+    return variance
+
+def analyze_burst_source(kind, source):
+    max_frames = settings.SCAN_BURST_MAX_FRAMES
+    if kind == 'video':
+        frames = read_video_frames(source, max_frames)
+    else:
+        frames = decode_burst_frames(source[:max_frames])
+    return analyze_burst(frames)
+
+def analyze_burst(frames):
+    accepted = []
+    rejections = Counter()
+    sharpest = None
+    total = 0
+
+    outcome = 'error'
+    started = time.perf_counter()
+    try:
+        with tracking_mesh_pool().checkout() as face_mesh:
+            # Tracking state must not leak between users' bursts.
+            face_mesh.reset()
+
+            for image, size in frames:
+                total += 1
+                try:
+                    if image is None:
+                        raise ScanRejected('undecodable')
+                    variance = check_image_quality(image)
+
+                    results = face_mesh.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+                    if not results.multi_face_landmarks:
+                        raise ScanRejected('no_face')
+
+                    points = landmarks_to_array(results.multi_face_landmarks[0].landmark)
+                    metrics = compute_face_metrics(points, *size)
+                    if metrics['rejection']:
+                        raise ScanRejected(metrics['rejection'])
+                except ScanRejected as e:
+                    rejections[e.code] += 1
+                    continue
+
+                accepted.append([metrics[field] for field in METRIC_FIELDS])
+                if sharpest is None or variance > sharpest[0]:
+                    sharpest = (variance, image, points, size)
+
+        if len(accepted) < settings.SCAN_BURST_MIN_FRAMES:
+            if rejections:
+                raise ScanRejected(rejections.most_common(1)[0][0])
+            raise ScanRejected('undecodable' if not total else 'no_face')
+
+        result = aggregate_burst_metrics(np.array(accepted))
+        _, image, points, (width, height) = sharpest
+        result.update(
+            landmarks=pack_landmarks(points),
+            image_width=width,
+            image_height=height,
+            frame_count=len(accepted)
+        )
+        outcome = 'ok'
+        return result, encode_frame(image)
+    except ValueError as e:
+        outcome = rejection_code(e)
+        raise
+    finally:
+        telemetry.observe('scan_burst_seconds', time.perf_counter() - started, outcome=outcome)
+        telemetry.increment('scan_burst_frames_total', total - len(accepted), result='rejected')
+        telemetry.increment('scan_burst_frames_total', len(accepted), result='accepted')
+
+def aggregate_burst_metrics(values):
+    # Median and scaled MAD: one bad frame cannot drag the result.
+    median = np.median(values, axis=0)
+    dispersion = np.median(np.abs(values - median), axis=0) * MAD_SCALE
+
+    result = {}
+    spread = {}
+    for i, field in enumerate(METRIC_FIELDS):
+        digits = METRIC_DIGITS[field]
+        result[field] = round(float(median[i]), digits)
+        spread[field] = round(float(dispersion[i]), digits + 1)
+    result['metric_dispersion'] = spread
+    return result
+
+def encode_frame(image):
+    ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 92])
+    if not ok:
+        raise ScanRejected('undecodable')
+    return encoded.ravel()
+
+def preflight_image_buffer(file_bytes):
+    outcome = 'error'
+    started = time.perf_counter()
+    try:
+        image, _ = decode_scan_image(file_bytes, settings.SCAN_PREFLIGHT_MAX_DIMENSION)
+        check_image_quality(image)
+
+        detection = detect_single_face(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        keypoints = [(point.x, point.y) for point in detection.location_data.relative_keypoints]
+
+        rejection = detection_rejection(keypoints, detection_box(detection))
+        if rejection:
+            raise ScanRejected(rejection)
+
+        outcome = 'ok'
+    except ValueError as e:
+        outcome = rejection_code(e)
+        raise
+    finally:
+        telemetry.observe('scan_preflight_seconds', time.perf_counter() - started, outcome=outcome)
\ No newline at end of file
@@ -0,0 +1,199 @@
+import multiprocessing
+import os
+import platform
+import resource
+import time
+from collections import defaultdict
+
+import cv2
+import numpy as np
+from django.conf import settings
+
+from .ai_logic import ANALYSIS_STAGES, analyze_image_buffer, stage_listener
+from .metrics import METRICS_VERSION, rejection_code
+from .pool import init_worker
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), 'benchmark_corpus')
+# Cropped from the NASA astronaut portrait shipped with scikit-image (public domain).
+REFERENCE_FACE = 'astronaut_face.jpg'
+DEFAULT_RESOLUTIONS = (480, 1080, 2160, 4032)
+CORPUS_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+
+def _encode(image):
+    ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    if not ok:
+        raise RuntimeError("Could not encode benchmark image")
+    return encoded.ravel()
+
+
+def _with_grain(image, edge, rng):
+    # Upscaled sources are too smooth for the blur gate; grain stands in for sensor noise
+    # and grows with the size so it survives the downscale to SCAN_MAX_DIMENSION.
+    sigma = 6 * max(1.0, edge / 1280)
+    noisy = image + rng.normal(0, sigma, image.shape)
+    return np.clip(noisy, 0, 255).astype(np.uint8)
+
+
+def _resize_to(image, edge):
+    height, width = image.shape[:2]
+    scale = edge / max(height, width)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+    return cv2.resize(image, size, interpolation=interpolation)
+
+
+def build_corpus(resolutions=DEFAULT_RESOLUTIONS, extra_dir=None, seed=0):
+    corpus = []
+    face = cv2.imread(os.path.join(CORPUS_DIR, REFERENCE_FACE))
+
+    for edge in resolutions:
+        rng = np.random.default_rng(seed + edge)
+        corpus.append((f"face_{edge}", _encode(_with_grain(_resize_to(face, edge), edge, rng))))
+
+        # Bright, textured frame with no face: runs every stage up to the mesh.
+        height, width = edge, edge * 3 // 4
+        gradient = np.linspace(90, 200, width, dtype=np.float64)[np.newaxis, :, np.newaxis]
+        frame = np.broadcast_to(gradient, (height, width, 3))
+        corpus.append((f"noface_{edge}", _encode(_with_grain(frame, edge, rng))))
+
+    rng = np.random.default_rng(seed)
+    dark = rng.integers(0, 30, (resolutions[0], resolutions[0] * 3 // 4, 3), dtype=np.uint8)
+    corpus.append((f"dark_{resolutions[0]}", _encode(dark)))
+
+    if extra_dir:
+        for name in sorted(os.listdir(extra_dir)):
+            if name.lower().endswith(CORPUS_EXTENSIONS):
+                data = np.fromfile(os.path.join(extra_dir, name), dtype=np.uint8)
+                corpus.append((f"extra/{name}", data))
+
+    return corpus
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_one(name, data):
+    stages = defaultdict(float)
+
+    def record(stage, elapsed):
+        stages[stage] += elapsed
+
+    started = time.perf_counter()
+    try:
+        with stage_listener(record):
+            analyze_image_buffer(data)
+        outcome = 'ok'
+    except ValueError as e:
+        outcome = rejection_code(e)
+    elapsed = time.perf_counter() - started
+
+    return {
+        'image': name,
+        'outcome': outcome,
+        'latency': elapsed,
+        'stages': dict(stages),
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def _run_one(args):
+    return run_one(*args)
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values) * 1000
+    return {
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p95_ms': round(float(np.percentile(values, 95)), 3),
+        'mean_ms': round(float(values.mean()), 3),
+    }
+
+
+def summarize(samples, wall_time):
+    stages = {stage: [s['stages'][stage] for s in samples if stage in s['stages']] for stage in ANALYSIS_STAGES}
+
+    per_image = defaultdict(list)
+    outcomes = {}
+    for sample in samples:
+        per_image[sample['image']].append(sample['latency'])
+        outcomes[sample['image']] = sample['outcome']
+
+    return {
+        'images': len(samples),
+        'wall_time_s': round(wall_time, 3),
+        'images_per_sec': round(len(samples) / wall_time, 2) if wall_time else None,
+        'latency': _percentiles([s['latency'] for s in samples]),
+        'stages': {stage: _percentiles(values) for stage, values in stages.items() if values},
+        'per_image': {
+            name: dict(_percentiles(latencies), outcome=outcomes[name])
+            for name, latencies in per_image.items()
+        },
+        'peak_rss_mb': round(max(s['peak_rss_mb'] for s in samples), 1),
+    }
+
+
+def run_single(corpus, repeat=3, warmup=1):
+    for _ in range(warmup):
+        for name, data in corpus:
+            run_one(name, data)
+
+    samples = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for name, data in corpus:
+            samples.append(run_one(name, data))
+    return summarize(samples, time.perf_counter() - started)
+
+
+def run_multi(corpus, processes, repeat=3):
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(processes, initializer=init_worker) as pool:
+        # Warm every child before timing; each one builds its own FaceMesh graph.
+        pool.map(_run_one, [corpus[0]] * processes * 2, chunksize=1)
+
+        started = time.perf_counter()
+        samples = pool.map(_run_one, list(corpus) * repeat, chunksize=1)
+        wall_time = time.perf_counter() - started
+
+    summary = summarize(samples, wall_time)
+    summary['processes'] = processes
+    return summary
+
+
+def environment():
+    import mediapipe as mp
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'opencv': cv2.__version__,
+        'mediapipe': mp.__version__,
+        'numpy': np.__version__,
+        'metrics_version': METRICS_VERSION,
+        'max_dimension': settings.SCAN_MAX_DIMENSION,
+        'opencv_threads': cv2.getNumThreads(),
+        'inference_threads': settings.SCAN_INFERENCE_THREADS,
+    }
+
+
+def compare(baseline, current):
+    rows = []
+    for mode in ('single', 'multi'):
+        old, new = baseline.get(mode), current.get(mode)
+        if not old or not new:
+            continue
+        pairs = [('latency', old['latency'], new['latency'])]
+        pairs += [(stage, old['stages'].get(stage), new['stages'].get(stage)) for stage in ANALYSIS_STAGES]
+        for label, before, after in pairs:
+            if before and after and before['p50_ms']:
+                change = (after['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100
+                rows.append((mode, label, before['p50_ms'], after['p50_ms'], round(change, 1)))
+        if old.get('images_per_sec') and new.get('images_per_sec'):
+            change = (new['images_per_sec'] - old['images_per_sec']) / old['images_per_sec'] * 100
+            rows.append((mode, 'images_per_sec', old['images_per_sec'], new['images_per_sec'], round(change, 1)))
+    return rows
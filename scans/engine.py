@@ -0,0 +1,180 @@
+import logging
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class EnginePool:
+    def __init__(self, factory, size, timeout=None):
+        self.factory = factory
+        self.size = max(1, int(size))
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=self.size)
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self, timeout):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+
+        if can_create:
+            try:
+                return self.factory()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise RuntimeError("Face analysis engine is busy. Please try again.")
+
+    def _discard(self, engine):
+        with self._lock:
+            self._created -= 1
+        try:
+            engine.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        engine = self._acquire(self.timeout if timeout is None else timeout)
+        try:
+            yield engine
+        except Exception:
+            logger.warning("Discarding face engine after failure; it will be rebuilt on next checkout.")
+            self._discard(engine)
+            raise
+        else:
+            self._idle.put_nowait(engine)
+
+    def warm(self, prime=None):
+        engines = []
+        try:
+            while len(engines) < self.size:
+                engine = self._acquire(self.timeout)
+                engines.append(engine)
+                if prime is not None:
+                    prime(engine)
+        finally:
+            for engine in engines:
+                self._idle.put_nowait(engine)
+
+    def close(self):
+        while True:
+            try:
+                engine = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(engine)
+
+
+def set_inference_threads(graph_config, threads):
+    from mediapipe.calculators.tensor.inference_calculator_pb2 import InferenceCalculatorOptions
+
+    for node in graph_config.node:
+        if not node.calculator.startswith('InferenceCalculator'):
+            continue
+        if node.node_options:
+            for packed in node.node_options:
+                if packed.Is(InferenceCalculatorOptions.DESCRIPTOR):
+                    options = InferenceCalculatorOptions()
+                    packed.Unpack(options)
+                    options.delegate.xnnpack.num_threads = threads
+                    packed.Pack(options)
+        else:
+            node.options.Extensions[InferenceCalculatorOptions.ext].delegate.xnnpack.num_threads = threads
+
+
+def with_inference_threads(solution_class):
+    threads = settings.SCAN_INFERENCE_THREADS
+    if threads <= 0:
+        return solution_class
+
+    # The legacy solutions API has no thread option, so the XNNPACK delegate
+    # is configured on the expanded graph before it starts. This hook runs for
+    # every solution; _modify_calculator_options is skipped by graphs such as
+    # face detection that are configured through graph_options only.
+    class ThreadedSolution(solution_class):
+        def _initialize_graph_interface(self, validated_graph, *args, **kwargs):
+            graph_config = super()._initialize_graph_interface(validated_graph, *args, **kwargs)
+            set_inference_threads(graph_config, threads)
+            return graph_config
+
+    return ThreadedSolution
+
+
+def build_face_mesh():
+    import mediapipe as mp
+
+    return with_inference_threads(mp.solutions.face_mesh.FaceMesh)(
+        static_image_mode=True,
+        max_num_faces=1,
+        refine_landmarks=True,
+        min_detection_confidence=0.5
+    )
+
+
+def build_tracking_face_mesh():
+    import mediapipe as mp
+
+    return with_inference_threads(mp.solutions.face_mesh.FaceMesh)(
+        static_image_mode=False,
+        max_num_faces=1,
+        refine_landmarks=True,
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5
+    )
+
+
+def build_face_detector():
+    import mediapipe as mp
+
+    # Short-range model: selfie framing, a few milliseconds per low-res frame.
+    return with_inference_threads(mp.solutions.face_detection.FaceDetection)(
+        model_selection=0,
+        min_detection_confidence=0.5
+    )
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_engine_pool(name, factory, size):
+    # MediaPipe graphs do not survive fork(), so pools are keyed per process.
+    key = (name, os.getpid())
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = EnginePool(factory, size, timeout=settings.FACE_MESH_POOL_TIMEOUT)
+                _pools[key] = pool
+    return pool
+
+
+def face_mesh_pool():
+    return get_engine_pool('face_mesh', build_face_mesh, settings.FACE_MESH_POOL_SIZE)
+
+
+def tracking_mesh_pool():
+    return get_engine_pool('face_mesh_tracking', build_tracking_face_mesh, settings.FACE_MESH_POOL_SIZE)
+
+
+def face_detection_pool():
+    return get_engine_pool('face_detection', build_face_detector, settings.FACE_DETECTION_POOL_SIZE)
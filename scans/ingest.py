@@ -0,0 +1,196 @@
+import hashlib
+import io
+import mmap
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+
+from .metrics import ScanRejected
+
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'GIF8', '.gif'),
+    (b'BM', '.bmp'),
+)
+
+
+class ScanImageBuffer(File):
+    def __init__(self, data, name):
+        super().__init__(None, name)
+        self.data = data
+
+    @property
+    def size(self):
+        return self.data.nbytes
+
+    def chunks(self, chunk_size=None):
+        chunk_size = chunk_size or self.DEFAULT_CHUNK_SIZE
+        view = memoryview(self.data)
+        for offset in range(0, len(view), chunk_size):
+            yield view[offset:offset + chunk_size].tobytes()
+
+    def multiple_chunks(self, chunk_size=None):
+        return self.size > (chunk_size or self.DEFAULT_CHUNK_SIZE)
+
+    def open(self, mode=None):
+        return self
+
+    def close(self):
+        pass
+
+
+def _release(exported):
+    try:
+        if isinstance(exported, memoryview):
+            exported.release()
+        else:
+            exported.close()
+    except BufferError:
+        # Callers still hold array views; the export is freed with them.
+        pass
+
+
+def _fileno(image_file):
+    try:
+        return image_file.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+
+
+@contextmanager
+def open_scan_buffer(image_file):
+    size = getattr(image_file, 'size', None)
+    if size is not None and size > settings.SCAN_MAX_UPLOAD_BYTES:
+        raise ScanRejected('too_large')
+    if size == 0:
+        raise ScanRejected('undecodable')
+
+    raw = getattr(image_file, 'file', image_file)
+    if isinstance(raw, io.BytesIO):
+        view = raw.getbuffer()
+        try:
+            yield np.frombuffer(view, dtype=np.uint8)
+        finally:
+            _release(view)
+        return
+
+    fileno = _fileno(image_file)
+    if fileno is not None:
+        file_size = os.fstat(fileno).st_size
+        if file_size == 0:
+            raise ScanRejected('undecodable')
+        if file_size > settings.SCAN_MAX_UPLOAD_BYTES:
+            raise ScanRejected('too_large')
+        mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        try:
+            yield np.frombuffer(mapped, dtype=np.uint8)
+        finally:
+            _release(mapped)
+        return
+
+    yield read_into_buffer(image_file, size)
+
+
+@contextmanager
+def open_scan_source(source):
+    # Pool workers receive raw bytes or a temp-file path instead of the upload object.
+    if isinstance(source, bytes):
+        yield np.frombuffer(source, dtype=np.uint8)
+        return
+    if isinstance(source, str):
+        with open(source, 'rb') as image_file:
+            with open_scan_buffer(image_file) as file_bytes:
+                yield file_bytes
+        return
+    with open_scan_buffer(source) as file_bytes:
+        yield file_bytes
+
+
+def hash_buffer(buffer):
+    return hashlib.sha256(memoryview(buffer)).hexdigest()
+
+
+def image_extension(buffer, fallback_name=''):
+    head = memoryview(buffer)[:12].tobytes()
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    for signature, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    return os.path.splitext(fallback_name)[1].lower() or '.jpg'
+
+
+def content_addressed_name(digest, extension):
+    return f"scan_images/{digest[:2]}/{digest}{extension}"
+
+
+def store_scan_image(buffer, digest, original_name=''):
+    name = content_addressed_name(digest, image_extension(buffer, original_name))
+    if default_storage.exists(name):
+        return name
+    return default_storage.save(name, ScanImageBuffer(buffer, name))
+
+
+def read_into_buffer(image_file, size=None):
+    if size is None:
+        data = image_file.read(settings.SCAN_MAX_UPLOAD_BYTES + 1)
+        if len(data) > settings.SCAN_MAX_UPLOAD_BYTES:
+            raise ScanRejected('too_large')
+        return np.frombuffer(data, dtype=np.uint8)
+
+    buffer = np.empty(size, dtype=np.uint8)
+    view = memoryview(buffer)
+    offset = 0
+    while offset < size:
+        read = image_file.readinto(view[offset:])
+        if not read:
+            break
+        offset += read
+    return buffer[:offset]
+
+
+class MemoryBudget:
+    def __init__(self, limit, timeout=None):
+        self.limit = limit
+        self.timeout = timeout
+        self._used = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, nbytes):
+        if nbytes > self.limit:
+            raise ScanRejected('too_large')
+
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._used + nbytes <= self.limit, timeout=self.timeout):
+                raise RuntimeError("Scan memory budget exhausted. Please try again.")
+            self._used += nbytes
+
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._used -= nbytes
+                self._condition.notify_all()
+
+
+_budgets = {}
+_budgets_lock = threading.Lock()
+
+
+def scan_memory_budget():
+    pid = os.getpid()
+    budget = _budgets.get(pid)
+    if budget is None:
+        with _budgets_lock:
+            budget = _budgets.get(pid)
+            if budget is None:
+                budget = MemoryBudget(settings.SCAN_WORKER_MEMORY_LIMIT, timeout=settings.SCAN_MEMORY_WAIT_TIMEOUT)
+                _budgets[pid] = budget
+    return budget
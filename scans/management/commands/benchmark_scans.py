@@ -0,0 +1,52 @@
+import json
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from scans.benchmark import DEFAULT_RESOLUTIONS, build_corpus, compare, environment, run_multi, run_single
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the face analysis pipeline offline and write the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--processes', type=int, default=2, help='Workers for the multi-process run; 0 to skip it.')
+        parser.add_argument(
+            '--resolutions',
+            default=','.join(str(edge) for edge in DEFAULT_RESOLUTIONS),
+            help='Comma separated long-edge sizes for the generated corpus.'
+        )
+        parser.add_argument('--corpus', help='Directory of extra images to include as-is.')
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout.')
+        parser.add_argument('--compare', help='Previous JSON report to diff p50 timings against.')
+
+    def handle(self, *args, **options):
+        try:
+            resolutions = [int(edge) for edge in options['resolutions'].split(',') if edge.strip()]
+        except ValueError:
+            raise CommandError("--resolutions must be a comma separated list of integers")
+        if not resolutions:
+            raise CommandError("--resolutions must not be empty")
+
+        corpus = build_corpus(resolutions, options['corpus'])
+        self.stderr.write(f"Benchmarking {len(corpus)} images x {options['repeat']}...")
+
+        report = {'environment': environment(), 'corpus': [name for name, _ in corpus]}
+        report['single'] = run_single(corpus, options['repeat'])
+        self.stderr.write(f" -> single: {report['single']['images_per_sec']} images/sec")
+
+        if options['processes'] > 0:
+            report['multi'] = run_multi(corpus, options['processes'], options['repeat'])
+            self.stderr.write(f" -> {options['processes']} processes: {report['multi']['images_per_sec']} images/sec")
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            sys.stdout.write(output + "\n")
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            for mode, label, before, after, change in compare(baseline, report):
+                self.stderr.write(f"{mode:>6} {label:<15} {before:>10} -> {after:<10} ({change:+.1f}%)")
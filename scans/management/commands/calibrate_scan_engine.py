@@ -0,0 +1,108 @@
+import json
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from scans.benchmark import build_corpus, environment, run_multi
+
+THREAD_ENV = ('SCAN_OPENCV_THREADS', 'SCAN_INFERENCE_THREADS')
+
+
+def parse_counts(value, option):
+    try:
+        counts = sorted({int(count) for count in value.split(',') if count.strip()})
+    except ValueError:
+        raise CommandError(f"{option} must be a comma separated list of integers")
+    if not counts:
+        raise CommandError(f"{option} must not be empty")
+    return counts
+
+
+class Command(BaseCommand):
+    help = 'Sweep worker processes and thread counts on the benchmark corpus and save the fastest setup'
+
+    def add_arguments(self, parser):
+        cpus = os.cpu_count() or 1
+        parser.add_argument(
+            '--processes',
+            default=','.join(str(count) for count in sorted({1, max(1, cpus // 2), cpus})),
+            help='Comma separated worker process counts to try.'
+        )
+        parser.add_argument('--inference-threads', default='1,2,4', help='XNNPACK threads per graph to try.')
+        parser.add_argument(
+            '--opencv-threads',
+            default='1,0',
+            help='OpenCV threads per process to try; 0 means an even share of the cores.'
+        )
+        parser.add_argument('--repeat', type=int, default=2)
+        parser.add_argument('--resolutions', default='1080,2160', help='Long-edge sizes for the corpus.')
+        parser.add_argument(
+            '--allow-oversubscribe',
+            action='store_true',
+            help='Also try setups whose processes x threads exceed the core count.'
+        )
+        parser.add_argument('--output', default=settings.SCAN_ENGINE_CONFIG)
+
+    def handle(self, *args, **options):
+        cpus = os.cpu_count() or 1
+        corpus = build_corpus(parse_counts(options['resolutions'], '--resolutions'))
+        candidates = self.candidates(options, cpus)
+        if not candidates:
+            raise CommandError("No setup fits the core count; pass --allow-oversubscribe to try them anyway.")
+
+        self.stderr.write(f"Calibrating {len(candidates)} setups on {cpus} cores...")
+        saved_env = {name: os.environ.get(name) for name in THREAD_ENV}
+        results = []
+        try:
+            for processes, opencv_threads, inference_threads in candidates:
+                # Spawned children read these while Django sets up, ahead of any calibration file.
+                os.environ['SCAN_OPENCV_THREADS'] = str(opencv_threads)
+                os.environ['SCAN_INFERENCE_THREADS'] = str(inference_threads)
+                summary = run_multi(corpus, processes, options['repeat'])
+                results.append({
+                    'settings': {
+                        'SCAN_POOL_PROCESSES': processes,
+                        'SCAN_OPENCV_THREADS': opencv_threads,
+                        'SCAN_INFERENCE_THREADS': inference_threads,
+                    },
+                    'images_per_sec': summary['images_per_sec'],
+                    'latency': summary['latency'],
+                    'peak_rss_mb': summary['peak_rss_mb'],
+                })
+                self.stderr.write(
+                    f" -> {processes} processes, {opencv_threads} OpenCV / {inference_threads} inference threads: "
+                    f"{summary['images_per_sec']} images/sec, p95 {summary['latency']['p95_ms']} ms"
+                )
+        finally:
+            for name, value in saved_env.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+        best = max(results, key=lambda result: result['images_per_sec'] or 0)
+        report = {
+            'environment': environment(),
+            'settings': best['settings'],
+            'images_per_sec': best['images_per_sec'],
+            'results': results,
+        }
+
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f"Best: {best['settings']} at {best['images_per_sec']} images/sec, written to {options['output']}"
+        ))
+
+    def candidates(self, options, cpus):
+        setups = []
+        for processes in parse_counts(options['processes'], '--processes'):
+            if processes < 1:
+                raise CommandError("--processes values must be at least 1")
+            share = max(1, cpus // processes)
+            opencv_counts = sorted({count or share for count in parse_counts(options['opencv_threads'], '--opencv-threads')})
+            for inference_threads in parse_counts(options['inference_threads'], '--inference-threads'):
+                if inference_threads > share and inference_threads > 1 and not options['allow_oversubscribe']:
+                    continue
+                for opencv_threads in opencv_counts:
+                    setups.append((processes, opencv_threads, inference_threads))
+        return setups
@@ -0,0 +1,191 @@
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from scans.metrics import METRIC_FIELDS, METRICS_VERSION
+from scans.models import FaceScan, ScanAggregate
+from scans.pool import init_worker, recompute_rows
+from scans.services import blend_metrics, rebuild_scan_aggregates, update_user_goals
+from workouts.dashboard import mark_dashboards_stale
+from workouts.leaderboard import update_leaderboards
+
+GEOMETRY_UPDATE_FIELDS = list(METRIC_FIELDS) + ['landmarks', 'image_width', 'image_height']
+
+
+class Command(BaseCommand):
+    help = 'Recompute metrics for completed scans in parallel, resuming from the last checkpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--chunk-size', type=int, default=200, help='Scans sent to a worker at a time.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per bulk_update query.')
+        parser.add_argument('--checkpoint', default=os.path.join(settings.BASE_DIR, 'recompute_scan_metrics.json'))
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint.')
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Only recompute these user ids.')
+
+    def handle(self, *args, **options):
+        self.checkpoint_path = options['checkpoint']
+        self.batch_size = options['batch_size']
+        state = self.load_checkpoint(options['restart'], options['users'])
+        self.resumed_from = state['last_pk']
+
+        scans = FaceScan.objects.filter(status='COMPLETED', pk__gt=state['last_pk']).order_by('pk')
+        if options['users']:
+            scans = scans.filter(user_id__in=options['users'])
+        total = scans.count()
+        # Users recomputed before an interruption still need their aggregates rebuilt on resume.
+        self.touched_users = set(state['touched_users'])
+
+        if not total:
+            self.finish(state)
+            self.stdout.write(self.style.SUCCESS("Nothing to recompute."))
+            return
+
+        self.stdout.write(
+            f"Recomputing {total} scans with {options['workers']} workers"
+            + (f", resuming after id {state['last_pk']}" if state['last_pk'] else "")
+        )
+
+        rows = scans.values_list(
+            'pk', 'user_id', 'landmarks', 'image_width', 'image_height', 'image', 'frame_count',
+            *METRIC_FIELDS
+        ).iterator(chunk_size=options['chunk_size'])
+
+        self.previous = {}
+        started = time.monotonic()
+        processed = 0
+
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(options['workers'], initializer=init_worker, initargs=(False,)) as pool:
+            pending = deque()
+            for chunk in self.chunked(rows, options['chunk_size']):
+                # Burst medians cannot be rebuilt from the single stored frame, so they are kept as-is.
+                work = [
+                    (row[0], bytes(row[2]) if row[2] else None, row[3], row[4], row[5])
+                    for row in chunk if not row[6]
+                ]
+                pending.append((chunk, pool.apply_async(recompute_rows, (work,))))
+
+                # Keep a bounded window in flight; chunks are applied in pk order for the smoothing chain.
+                if len(pending) >= options['workers'] * 2:
+                    processed += self.apply(state, *pending.popleft())
+                    self.report(state, processed, total, started)
+
+            while pending:
+                processed += self.apply(state, *pending.popleft())
+                self.report(state, processed, total, started)
+
+        self.finish(state)
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {state['updated']} updated, {state['skipped']} skipped."
+        ))
+
+    def load_checkpoint(self, restart, users):
+        fresh = {
+            'version': METRICS_VERSION, 'users': users, 'last_pk': 0, 'updated': 0, 'skipped': 0, 'touched_users': []
+        }
+        if restart or not os.path.exists(self.checkpoint_path):
+            return fresh
+
+        with open(self.checkpoint_path) as f:
+            state = json.load(f)
+
+        if state.get('version') != METRICS_VERSION or state.get('users') != users or 'touched_users' not in state:
+            self.stdout.write(self.style.WARNING("Checkpoint was written for a different run; starting over."))
+            return fresh
+        return state
+
+    def save_checkpoint(self, state):
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def chunked(self, rows, size):
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def previous_metrics(self, user_id, pk):
+        if user_id not in self.previous:
+            prior = None
+            if self.resumed_from:
+                prior = FaceScan.objects.filter(
+                    user_id=user_id,
+                    status='COMPLETED',
+                    pk__lt=pk
+                ).exclude(jawline_angle__isnull=True).order_by('-created_at').values(*METRIC_FIELDS).first()
+            self.previous[user_id] = prior
+        return self.previous[user_id]
+
+    def apply(self, state, chunk, result):
+        metric_updates = []
+        geometry_updates = []
+
+        results = {pk: outcome for pk, *outcome in result.get()}
+
+        for row in chunk:
+            pk, user_id = row[0], row[1]
+            metrics, geometry, error = results.get(pk, (None, None, None))
+            if metrics is None:
+                if error:
+                    state['skipped'] += 1
+                    self.stderr.write(f"Scan {pk} skipped: {error}")
+                stored = dict(zip(METRIC_FIELDS, row[7:]))
+                if stored['jawline_angle'] is not None:
+                    self.previous[user_id] = stored
+                continue
+
+            smoothed = blend_metrics(metrics, self.previous_metrics(user_id, pk))
+            self.previous[user_id] = smoothed
+            self.touched_users.add(user_id)
+
+            scan = FaceScan(pk=pk, **smoothed)
+            if geometry:
+                for field, value in geometry.items():
+                    setattr(scan, field, value)
+                geometry_updates.append(scan)
+            else:
+                metric_updates.append(scan)
+
+        if metric_updates:
+            FaceScan.objects.bulk_update(metric_updates, METRIC_FIELDS, batch_size=self.batch_size)
+        if geometry_updates:
+            FaceScan.objects.bulk_update(geometry_updates, GEOMETRY_UPDATE_FIELDS, batch_size=self.batch_size)
+
+        state['updated'] += len(metric_updates) + len(geometry_updates)
+        state['last_pk'] = chunk[-1][0]
+        state['touched_users'] = sorted(self.touched_users)
+        self.save_checkpoint(state)
+        return len(chunk)
+
+    def finish(self, state):
+        # Baselines, min/max and last values all derive from the rewritten history.
+        touched = sorted(self.touched_users)
+        for offset in range(0, len(touched), self.batch_size):
+            batch = touched[offset:offset + self.batch_size]
+            rebuild_scan_aggregates(batch)
+
+            # Goals, dashboards, cached scans and leaderboard scores all read the rewritten values.
+            latest = {aggregate.user_id: aggregate.latest() for aggregate in ScanAggregate.objects.filter(user_id__in=batch)}
+            update_user_goals({user_id: metrics for user_id, metrics in latest.items() if metrics})
+            mark_dashboards_stale(batch)
+            update_leaderboards(batch)
+
+        self.touched_users = set()
+        state['touched_users'] = []
+        self.save_checkpoint(state)
+
+    def report(self, state, processed, total, started):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(
+            f" -> {processed}/{total} scans, {processed / elapsed:.1f} scans/sec (last id {state['last_pk']})"
+        )
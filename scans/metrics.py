@@ -0,0 +1,200 @@
+import numpy as np
+
+METRIC_FIELDS = ('jawline_angle', 'symmetry_score', 'puffiness_index')
+METRIC_DIGITS = {'jawline_angle': 1, 'symmetry_score': 1, 'puffiness_index': 2}
+GEOMETRY_FIELDS = ('landmarks', 'image_width', 'image_height')
+BURST_FIELDS = ('frame_count', 'metric_dispersion')
+METRICS_VERSION = 2
+
+REJECTION_MESSAGES = {
+    'undecodable': "Could not decode image",
+    'too_large': "Image is too large. Please upload a smaller photo.",
+    'too_dark': "Lighting is too dark. Please face a light source.",
+    'too_blurry': "Image is too blurry. Please hold the camera steady.",
+    'no_face': "No face detected. Please ensure your face is clearly visible.",
+    'multiple_faces': "More than one face detected. Please make sure only you are in the frame.",
+    'not_frontal': "Please look straight at the camera.",
+    'not_level': "Please keep your head level.",
+    'too_close': "You are too close to the camera.",
+    'too_far': "You are too far from the camera.",
+}
+
+POSE_CHECKS = ('not_frontal', 'not_level', 'too_close', 'too_far')
+
+
+class ScanRejected(ValueError):
+    def __init__(self, code):
+        super().__init__(REJECTION_MESSAGES[code])
+        self.code = code
+
+    def __reduce__(self):
+        return (ScanRejected, (self.code,))
+
+
+def rejection_code(error):
+    return getattr(error, 'code', 'invalid')
+
+NOSE_TIP = 1
+MIDLINE = 168
+LEFT_CHEEK, RIGHT_CHEEK = 234, 454
+LEFT_JAW, RIGHT_JAW = 172, 397
+LEFT_EYE, RIGHT_EYE = 33, 263
+
+DETECTION_RIGHT_EYE, DETECTION_LEFT_EYE, DETECTION_NOSE_TIP = 0, 1, 2
+DETECTION_RIGHT_TRAGION, DETECTION_LEFT_TRAGION = 4, 5
+# The detector box starts at the brows; the mesh reaches a little higher.
+DETECTION_FOREHEAD_MARGIN = 0.08
+
+# Faces narrower than this are background passers-by, not a competing subject.
+MULTI_FACE_MIN_WIDTH = 0.1
+# Margin added around the detector box on each side before the mesh runs on the crop.
+ROI_PADDING = 0.3
+
+FRONTAL_RATIO_RANGE = (0.5, 2.0)
+MAX_EYE_TILT = 0.1
+FRAME_MARGIN = 0.01
+MIN_FACE_WIDTH = 0.20
+
+JAW_TRIPLES = np.array([(177, 172, 152), (401, 397, 152)])
+SYMMETRY_PAIRS = np.array([(33, 263), (133, 362), (61, 291), (234, 454), (172, 397)])
+
+LANDMARK_DTYPE = np.dtype((np.float32, 3))
+PACKED_LANDMARK_DTYPE = np.dtype('<i2')
+# 16-bit fixed point over [-3.5, 4.5): ~1e-4 steps, 4x finer than float16 near the frame edges.
+LANDMARK_QUANT_SCALE = 8192
+LANDMARK_QUANT_OFFSET = 0.5
+
+
+def landmarks_to_array(landmarks):
+    return np.fromiter(
+        ((lm.x, lm.y, lm.z) for lm in landmarks),
+        dtype=LANDMARK_DTYPE,
+        count=len(landmarks)
+    )
+
+
+def pack_landmarks(points):
+    quantized = np.round((np.asarray(points, dtype=np.float32) - LANDMARK_QUANT_OFFSET) * LANDMARK_QUANT_SCALE)
+    info = np.iinfo(PACKED_LANDMARK_DTYPE)
+    return np.clip(quantized, info.min, info.max).astype(PACKED_LANDMARK_DTYPE).tobytes()
+
+
+def unpack_landmarks(blob):
+    quantized = np.frombuffer(blob, dtype=PACKED_LANDMARK_DTYPE).reshape(-1, 3)
+    return quantized.astype(np.float32) / LANDMARK_QUANT_SCALE + LANDMARK_QUANT_OFFSET
+
+
+def roi_bounds(box, width, height, padding=ROI_PADDING):
+    xmin, ymin, box_width, box_height = box
+    center_x = (xmin + box_width / 2) * width
+    center_y = (ymin + box_height / 2) * height
+    half = max(box_width * width, box_height * height) * (0.5 + padding)
+
+    left = int(max(0, np.floor(center_x - half)))
+    top = int(max(0, np.floor(center_y - half)))
+    right = int(min(width, np.ceil(center_x + half)))
+    bottom = int(min(height, np.ceil(center_y + half)))
+    return left, top, right, bottom
+
+
+def map_roi_landmarks(points, roi, width, height):
+    left, top, right, bottom = roi
+    crop_width = right - left
+    points = np.asarray(points, dtype=np.float32).copy()
+    points[:, 0] = (points[:, 0] * crop_width + left) / width
+    points[:, 1] = (points[:, 1] * (bottom - top) + top) / height
+    # Mesh depth shares the x scale of the image it ran on.
+    points[:, 2] *= crop_width / width
+    return points
+
+
+def _norm(vectors):
+    return np.sqrt(np.sum(vectors * vectors, axis=-1))
+
+
+def pose_rejections(nose_x, left_x, right_x, eye_tilt, min_x, max_x, min_y, max_y):
+    left_dist = np.abs(nose_x - left_x)
+    right_dist = np.abs(nose_x - right_x)
+    ratio = np.divide(left_dist, right_dist, out=np.ones_like(left_dist), where=right_dist > 0)
+
+    checks = np.stack([
+        (ratio < FRONTAL_RATIO_RANGE[0]) | (ratio > FRONTAL_RATIO_RANGE[1]),
+        eye_tilt > MAX_EYE_TILT,
+        (min_x < FRAME_MARGIN) | (max_x > 1 - FRAME_MARGIN) | (min_y < FRAME_MARGIN) | (max_y > 1 - FRAME_MARGIN),
+        (max_x - min_x) < MIN_FACE_WIDTH,
+    ], axis=1)
+    failed = checks.any(axis=1)
+    first_failed = checks.argmax(axis=1)
+    return [POSE_CHECKS[i] if bad else None for i, bad in zip(first_failed, failed)]
+
+
+def detection_rejection(keypoints, box):
+    keypoints = np.asarray(keypoints, dtype=np.float32)
+    xmin, ymin, width, height = box
+    tragions = keypoints[[DETECTION_RIGHT_TRAGION, DETECTION_LEFT_TRAGION], 0]
+
+    return pose_rejections(
+        keypoints[DETECTION_NOSE_TIP:DETECTION_NOSE_TIP + 1, 0],
+        tragions[:1], tragions[1:],
+        np.abs(keypoints[DETECTION_LEFT_EYE:DETECTION_LEFT_EYE + 1, 1] - keypoints[DETECTION_RIGHT_EYE:DETECTION_RIGHT_EYE + 1, 1]),
+        np.array([tragions.min()]), np.array([tragions.max()]),
+        np.array([ymin - DETECTION_FOREHEAD_MARGIN * height]), np.array([ymin + height])
+    )[0]
+
+
+def compute_face_metrics(points, width, height):
+    points = np.asarray(points, dtype=np.float32)
+    single = points.ndim == 2
+    if single:
+        points = points[np.newaxis]
+
+    batch = points.shape[0]
+    x = points[..., 0]
+    y = points[..., 1]
+
+    rejections = pose_rejections(
+        x[:, NOSE_TIP], x[:, LEFT_CHEEK], x[:, RIGHT_CHEEK],
+        np.abs(y[:, LEFT_EYE] - y[:, RIGHT_EYE]),
+        x.min(axis=1), x.max(axis=1), y.min(axis=1), y.max(axis=1)
+    )
+
+    scale = np.empty((batch, 1, 2), dtype=np.float64)
+    scale[:, 0, 0] = np.broadcast_to(np.asarray(width, dtype=np.float64), (batch,))
+    scale[:, 0, 1] = np.broadcast_to(np.asarray(height, dtype=np.float64), (batch,))
+    coords = points[..., :2] * scale
+
+    ba = coords[:, JAW_TRIPLES[:, 0]] - coords[:, JAW_TRIPLES[:, 1]]
+    bc = coords[:, JAW_TRIPLES[:, 2]] - coords[:, JAW_TRIPLES[:, 1]]
+    denom = _norm(ba) * _norm(bc)
+    cosine = np.divide(np.sum(ba * bc, axis=-1), denom, out=np.zeros_like(denom), where=denom > 0)
+    angles = np.where(denom > 0, np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0))), 0.0)
+    jawline = angles.mean(axis=1)
+
+    px = coords[..., 0]
+    mid_x = px[:, MIDLINE:MIDLINE + 1]
+    l_dist = np.abs(mid_x - px[:, SYMMETRY_PAIRS[:, 0]])
+    r_dist = np.abs(px[:, SYMMETRY_PAIRS[:, 1]] - mid_x)
+    pair_denom = (l_dist + r_dist) / 2
+    deviation = np.divide(np.abs(l_dist - r_dist), pair_denom, out=np.zeros_like(pair_denom), where=pair_denom > 0)
+    symmetry = np.maximum(10, 100 - (deviation.mean(axis=1) * 50))
+
+    cheek_width = _norm(coords[:, LEFT_CHEEK] - coords[:, RIGHT_CHEEK])
+    jaw_width = _norm(coords[:, LEFT_JAW] - coords[:, RIGHT_JAW])
+    puffiness = np.divide(cheek_width, jaw_width, out=np.ones_like(cheek_width), where=jaw_width > 0)
+    puffiness = np.maximum(0.1, puffiness - 1.0)
+
+    metrics = {
+        'jawline_angle': np.round(jawline, 1),
+        'symmetry_score': np.round(symmetry, 1),
+        'puffiness_index': np.round(puffiness, 2),
+        'rejection': rejections,
+    }
+
+    if single:
+        return {
+            'jawline_angle': float(metrics['jawline_angle'][0]),
+            'symmetry_score': float(metrics['symmetry_score'][0]),
+            'puffiness_index': float(metrics['puffiness_index'][0]),
+            'rejection': rejections[0],
+        }
+    return metrics
@@ -1,11 +1,14 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+from .metrics import METRIC_FIELDS, unpack_landmarks
 
 User = get_user_model()
 
 class FaceScan(models.Model):
     STATUS_CHOICES = (
         ('PENDING', 'Pending'),
+        ('QUEUED', 'Queued'),
         ('PROCESSING', 'Processing'),
         ('COMPLETED', 'Completed'),
         ('FAILED', 'Failed'),
@@ -13,16 +16,81 @@ class FaceScan(models.Model):
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='scans')
     image = models.ImageField(upload_to='scan_images/')
+    image_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    status_changed_at = models.DateTimeField(default=timezone.now, help_text="When the scan last entered its current status.")
+    claim_token = models.UUIDField(null=True, blank=True, editable=False, help_text="Processing attempt that owns the scan.")
     error_message = models.TextField(blank=True, null=True)
     jawline_angle = models.FloatField(help_text="Degrees. Lower is sharper.", null=True, blank=True)
     symmetry_score = models.FloatField(help_text="Percentage 0-100.", null=True, blank=True)
     puffiness_index = models.FloatField(help_text="Lower is better.", null=True, blank=True)
+    landmarks = models.BinaryField(help_text="Normalized (N, 3) mesh, 16-bit fixed point.", null=True, blank=True, editable=False)
+    image_width = models.PositiveIntegerField(null=True, blank=True)
+    image_height = models.PositiveIntegerField(null=True, blank=True)
+    frame_count = models.PositiveSmallIntegerField(help_text="Frames aggregated for burst scans.", null=True, blank=True)
+    metric_dispersion = models.JSONField(help_text="Scaled MAD per metric for burst scans.", null=True, blank=True)
 
     def __str__(self):
         return f"{self.user.phone_number} - {self.status} - {self.created_at.strftime('%Y-%m-%d')}"
 
+    def landmark_array(self):
+        if not self.landmarks:
+            return None
+        return unpack_landmarks(self.landmarks)
+
+class ScanAggregate(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='scan_aggregate')
+    scan_count = models.PositiveIntegerField(default=0)
+    first_scan_at = models.DateTimeField(null=True, blank=True)
+    last_scan_at = models.DateTimeField(null=True, blank=True)
+
+    baseline_jawline_angle = models.FloatField(null=True, blank=True)
+    baseline_symmetry_score = models.FloatField(null=True, blank=True)
+    baseline_puffiness_index = models.FloatField(null=True, blank=True)
+    last_jawline_angle = models.FloatField(help_text="Smoothed value of the latest scan.", null=True, blank=True)
+    last_symmetry_score = models.FloatField(help_text="Smoothed value of the latest scan.", null=True, blank=True)
+    last_puffiness_index = models.FloatField(help_text="Smoothed value of the latest scan.", null=True, blank=True)
+    min_jawline_angle = models.FloatField(null=True, blank=True)
+    min_symmetry_score = models.FloatField(null=True, blank=True)
+    min_puffiness_index = models.FloatField(null=True, blank=True)
+    max_jawline_angle = models.FloatField(null=True, blank=True)
+    max_symmetry_score = models.FloatField(null=True, blank=True)
+    max_puffiness_index = models.FloatField(null=True, blank=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Scan aggregate for {self.user.phone_number}"
+
+    def metrics(self, prefix):
+        if not self.scan_count:
+            return None
+        return {field: getattr(self, f"{prefix}_{field}") for field in METRIC_FIELDS}
+
+    def baseline(self):
+        return self.metrics('baseline')
+
+    def latest(self):
+        return self.metrics('last')
+
+    def record(self, metrics, scanned_at):
+        for field in METRIC_FIELDS:
+            value = metrics[field]
+            if not self.scan_count:
+                setattr(self, f"baseline_{field}", value)
+                setattr(self, f"min_{field}", value)
+                setattr(self, f"max_{field}", value)
+            else:
+                setattr(self, f"min_{field}", min(getattr(self, f"min_{field}"), value))
+                setattr(self, f"max_{field}", max(getattr(self, f"max_{field}"), value))
+            setattr(self, f"last_{field}", value)
+
+        if not self.scan_count:
+            self.first_scan_at = scanned_at
+        self.last_scan_at = scanned_at
+        self.scan_count += 1
+
 class UserGoal(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='goals')
     
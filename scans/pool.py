@@ -0,0 +1,173 @@
+import asyncio
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+def init_worker(warm=True):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'facebuilder.settings')
+    # Each child runs one analysis at a time, so one warm engine is enough.
+    os.environ['FACE_MESH_POOL_SIZE'] = '1'
+
+    import django
+    django.setup()
+
+    if warm:
+        from .ai_logic import warm_up
+        warm_up()
+
+
+def _ping():
+    return os.getpid()
+
+
+def _analyze(source):
+    from .ai_logic import analyze_image_buffer
+    from .ingest import open_scan_source
+
+    with open_scan_source(source) as image_buffer:
+        return analyze_image_buffer(image_buffer)
+
+
+def _analyze_burst(kind, source):
+    from .ai_logic import analyze_burst_source
+    return analyze_burst_source(kind, source)
+
+
+def recompute_rows(rows):
+    import numpy as np
+    from django.core.files.storage import default_storage
+    from .ai_logic import analyze_image_buffer
+    from .ingest import open_scan_buffer
+    from .metrics import GEOMETRY_FIELDS, METRIC_FIELDS, compute_face_metrics, unpack_landmarks
+
+    results = {}
+
+    stored = [row for row in rows if row[1] and row[2] and row[3]]
+    if stored:
+        points = np.stack([unpack_landmarks(row[1]) for row in stored])
+        widths = np.array([row[2] for row in stored])
+        heights = np.array([row[3] for row in stored])
+        batch = compute_face_metrics(points, widths, heights)
+        for i, row in enumerate(stored):
+            if batch['rejection'][i]:
+                results[row[0]] = (None, None, batch['rejection'][i])
+            else:
+                metrics = {field: float(batch[field][i]) for field in METRIC_FIELDS}
+                results[row[0]] = (metrics, None, None)
+
+    for pk, landmarks, width, height, image_name in rows:
+        if pk in results:
+            continue
+        try:
+            with default_storage.open(image_name, 'rb') as image_file:
+                with open_scan_buffer(image_file) as image_buffer:
+                    analysis = analyze_image_buffer(image_buffer)
+        except Exception as e:
+            results[pk] = (None, None, str(e))
+            continue
+        metrics = {field: analysis[field] for field in METRIC_FIELDS}
+        geometry = {field: analysis[field] for field in GEOMETRY_FIELDS}
+        results[pk] = (metrics, geometry, None)
+
+    return [(row[0],) + results[row[0]] for row in rows]
+
+
+class ScanProcessPool:
+    def __init__(self, processes, max_tasks_per_child, queue_limit):
+        self.processes = max(1, processes)
+        self.max_tasks_per_child = max_tasks_per_child or None
+        self.max_pending = self.processes + max(0, queue_limit)
+        self._pool = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def start(self):
+        with self._lock:
+            if self._pool is None:
+                # Spawned children avoid inheriting the server's reactor threads. Unlike
+                # multiprocessing.Pool, the executor fails in-flight work when a child dies.
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=init_worker,
+                    max_tasks_per_child=self.max_tasks_per_child
+                )
+                # Children start on demand; these bring them up and warm before the first scan.
+                for _ in range(self.processes):
+                    self._pool.submit(_ping)
+        return self._pool
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _discard(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def submit(self, func, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise PoolSaturated()
+            self._pending += 1
+
+        try:
+            pool = self.start()
+            try:
+                return await asyncio.wrap_future(pool.submit(func, *args))
+            except BrokenProcessPool:
+                # A child was killed mid-task (segfault, OOM); the next submit gets a fresh pool.
+                self._discard(pool)
+                raise RuntimeError("Scan worker exited unexpectedly. Please try again.")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def analyze(self, image_file, image_buffer):
+        if hasattr(image_file, 'temporary_file_path'):
+            source = image_file.temporary_file_path()
+        else:
+            source = image_buffer.tobytes()
+        return await self.submit(_analyze, source)
+
+    async def analyze_burst(self, kind, source):
+        if kind == 'frames':
+            # Only in-memory uploads are copied; spooled frames cross over as their temp-file path.
+            source = [frame if isinstance(frame, str) else frame.read() for frame in source]
+        return await self.submit(_analyze_burst, kind, source)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def scan_process_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ScanProcessPool(
+                    settings.SCAN_POOL_PROCESSES,
+                    settings.SCAN_POOL_MAX_TASKS_PER_CHILD,
+                    settings.SCAN_POOL_QUEUE_LIMIT
+                )
+                atexit.register(_pool.close)
+    return _pool
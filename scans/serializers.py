@@ -4,8 +4,8 @@ from .models import FaceScan, UserGoal
 class FaceScanSerializer(serializers.ModelSerializer):
     class Meta:
         model = FaceScan
-        fields = ['id', 'image', 'status', 'error_message', 'jawline_angle', 'symmetry_score', 'puffiness_index', 'created_at']
-        read_only_fields = ['status', 'error_message', 'jawline_angle', 'symmetry_score', 'puffiness_index', 'created_at']
+        fields = ['id', 'image', 'status', 'error_message', 'jawline_angle', 'symmetry_score', 'puffiness_index', 'frame_count', 'metric_dispersion', 'created_at']
+        read_only_fields = ['status', 'error_message', 'jawline_angle', 'symmetry_score', 'puffiness_index', 'frame_count', 'metric_dispersion', 'created_at']
 
 class UserGoalSerializer(serializers.ModelSerializer):
     class Meta:
@@ -0,0 +1,358 @@
+import os
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+from . import telemetry
+from .ingest import hash_buffer, open_scan_buffer, store_scan_image
+from .metrics import BURST_FIELDS, GEOMETRY_FIELDS, METRIC_FIELDS, METRICS_VERSION, REJECTION_MESSAGES, ScanRejected
+from .models import FaceScan, ScanAggregate, UserGoal
+from payments.services import verify_subscription_status
+from workouts.dashboard import mark_dashboard_stale
+from workouts.leaderboard import update_leaderboard
+
+_warm_up_lock = threading.Lock()
+_warmed_up = False
+
+SCAN_PROGRESS = {
+    'PENDING': 0,
+    'QUEUED': 10,
+    'PROCESSING': 50,
+    'COMPLETED': 100,
+    'FAILED': 100,
+}
+
+
+# PROCESSING is claimable so an acks_late redelivery after a worker died picks its scans back up.
+CLAIMABLE_STATUSES = ('PENDING', 'QUEUED', 'PROCESSING')
+
+
+def claim_scans(scan_ids):
+    # Each attempt stamps its own token; results are only written while the row still carries it.
+    token = uuid.uuid4()
+    FaceScan.objects.filter(id__in=scan_ids, status__in=CLAIMABLE_STATUSES).update(
+        status='PROCESSING',
+        status_changed_at=timezone.now(),
+        claim_token=token
+    )
+    return token
+
+
+def lock_claimed_scans(scan_ids, token):
+    return set(
+        FaceScan.objects.select_for_update()
+        .filter(id__in=scan_ids, status='PROCESSING', claim_token=token)
+        .values_list('id', flat=True)
+    )
+
+
+def scan_lane(user):
+    return 'premium' if verify_subscription_status(user) else 'free'
+
+
+def lane_priority(lane):
+    return settings.SCAN_LANE_PRIORITIES[lane]
+
+
+def priority_lane(priority):
+    for lane, lane_priority_value in settings.SCAN_LANE_PRIORITIES.items():
+        if lane_priority_value == priority:
+            return lane
+    return 'default'
+
+
+def result_cache_key(image_hash):
+    return f"scan_result:v{METRICS_VERSION}:{image_hash}"
+
+
+def get_cached_result(image_hash):
+    if not image_hash:
+        return None
+    cached = cache.get(result_cache_key(image_hash))
+    telemetry.increment('scan_result_cache_total', result='miss' if cached is None else 'hit')
+    return cached
+
+
+def cache_result(image_hash, metrics=None, rejection=None):
+    if not image_hash:
+        return
+    result = {'metrics': metrics} if rejection is None else {'rejection': rejection}
+    cache.set(result_cache_key(image_hash), result, timeout=settings.SCAN_RESULT_CACHE_TTL)
+
+
+def cache_rejection(image_hash, error):
+    cache_result(image_hash, rejection=getattr(error, 'code', None) or str(error))
+
+
+def raise_for_cached(result):
+    if 'rejection' in result:
+        rejection = result['rejection']
+        if rejection in REJECTION_MESSAGES:
+            raise ScanRejected(rejection)
+        raise ValueError(rejection)
+    return result['metrics']
+
+
+def analyze_with_cache(image_buffer, image_hash):
+    cached = get_cached_result(image_hash)
+    if cached is not None:
+        return raise_for_cached(cached)
+    return analyze_and_cache(image_buffer, image_hash)
+
+
+def analyze_and_cache(image_buffer, image_hash):
+    # cv2 and mediapipe load on first use so non-scan processes never import them.
+    from .ai_logic import analyze_image_buffer
+
+    try:
+        metrics = analyze_image_buffer(image_buffer)
+    except ValueError as e:
+        cache_rejection(image_hash, e)
+        raise
+
+    cache_result(image_hash, metrics=metrics)
+    return metrics
+
+
+def preflight_scan(image_file):
+    from .ai_logic import preflight_image_buffer
+
+    if image_file.size > settings.SCAN_PREFLIGHT_MAX_UPLOAD_BYTES:
+        raise ScanRejected('too_large')
+
+    with open_scan_buffer(image_file) as image_buffer:
+        preflight_image_buffer(image_buffer)
+
+
+def blend_metrics(metrics, previous=None):
+    final_jawline = metrics['jawline_angle']
+    final_symmetry = metrics['symmetry_score']
+    final_puffiness = metrics['puffiness_index']
+
+    if previous:
+        final_jawline = (final_jawline * 0.7) + (previous['jawline_angle'] * 0.3)
+        final_symmetry = (final_symmetry * 0.7) + (previous['symmetry_score'] * 0.3)
+        final_puffiness = (final_puffiness * 0.7) + (previous['puffiness_index'] * 0.3)
+
+    return {
+        'jawline_angle': round(final_jawline, 1),
+        'symmetry_score': round(final_symmetry, 1),
+        'puffiness_index': round(final_puffiness, 2)
+    }
+
+
+def goal_targets(metrics):
+    return {
+        'target_jawline': round(metrics['jawline_angle'] * 0.95, 1),
+        'target_symmetry': min(100, round(metrics['symmetry_score'] * 1.10, 1)),
+        'target_puffiness': 0.20
+    }
+
+
+def update_user_goal(user, metrics):
+    UserGoal.objects.update_or_create(user=user, defaults=goal_targets(metrics))
+
+
+def update_user_goals(metrics_by_user):
+    existing = {goal.user_id: goal for goal in UserGoal.objects.filter(user_id__in=metrics_by_user)}
+    now = timezone.now()
+    created = []
+
+    for user_id, metrics in metrics_by_user.items():
+        targets = goal_targets(metrics)
+        goal = existing.get(user_id)
+        if goal is None:
+            created.append(UserGoal(user_id=user_id, **targets))
+            continue
+        for field, value in targets.items():
+            setattr(goal, field, value)
+        goal.updated_at = now
+
+    if existing:
+        UserGoal.objects.bulk_update(existing.values(), ['target_jawline', 'target_symmetry', 'target_puffiness', 'updated_at'])
+    if created:
+        UserGoal.objects.bulk_create(created, ignore_conflicts=True)
+
+
+AGGREGATE_UPDATE_FIELDS = [
+    'scan_count', 'first_scan_at', 'last_scan_at',
+    *(f"{prefix}_{field}" for prefix in ('baseline', 'last', 'min', 'max') for field in METRIC_FIELDS),
+    'updated_at',
+]
+
+
+def build_scan_aggregate(user_id):
+    completed = FaceScan.objects.filter(user_id=user_id, status='COMPLETED').exclude(jawline_angle__isnull=True)
+    stats = completed.aggregate(
+        scan_count=Count('id'),
+        first_scan_at=Min('created_at'),
+        last_scan_at=Max('created_at'),
+        **{f"min_{field}": Min(field) for field in METRIC_FIELDS},
+        **{f"max_{field}": Max(field) for field in METRIC_FIELDS},
+    )
+    aggregate = ScanAggregate(user_id=user_id, **stats)
+
+    if aggregate.scan_count:
+        first = completed.order_by('created_at').values(*METRIC_FIELDS).first()
+        last = completed.order_by('-created_at').values(*METRIC_FIELDS).first()
+        for field in METRIC_FIELDS:
+            setattr(aggregate, f"baseline_{field}", first[field])
+            setattr(aggregate, f"last_{field}", last[field])
+    return aggregate
+
+
+def get_scan_aggregate(user_id):
+    aggregate = ScanAggregate.objects.filter(user_id=user_id).first()
+    if aggregate is None:
+        # History from before aggregates existed is folded in once, on first use.
+        aggregate = build_scan_aggregate(user_id)
+        ScanAggregate.objects.bulk_create([aggregate], ignore_conflicts=True)
+    return aggregate
+
+
+def lock_scan_aggregates(user_ids):
+    user_ids = set(user_ids)
+    existing = set(ScanAggregate.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+    missing = user_ids - existing
+    if missing:
+        ScanAggregate.objects.bulk_create([build_scan_aggregate(user_id) for user_id in missing], ignore_conflicts=True)
+
+    locked = ScanAggregate.objects.select_for_update().filter(user_id__in=user_ids).order_by('user_id')
+    return {aggregate.user_id: aggregate for aggregate in locked}
+
+
+def save_scan_aggregates(aggregates):
+    now = timezone.now()
+    for aggregate in aggregates:
+        aggregate.updated_at = now
+    ScanAggregate.objects.bulk_update(aggregates, AGGREGATE_UPDATE_FIELDS)
+
+
+def rebuild_scan_aggregates(user_ids):
+    with transaction.atomic():
+        ScanAggregate.objects.filter(user_id__in=user_ids).delete()
+        ScanAggregate.objects.bulk_create([build_scan_aggregate(user_id) for user_id in user_ids])
+
+
+def scan_geometry(raw_metrics):
+    return {field: raw_metrics.get(field) for field in GEOMETRY_FIELDS + BURST_FIELDS}
+
+
+@contextmanager
+def burst_source(frame_files, video_file):
+    if video_file is not None:
+        if video_file.size > settings.SCAN_MAX_UPLOAD_BYTES:
+            raise ScanRejected('too_large')
+        if hasattr(video_file, 'temporary_file_path'):
+            yield 'video', video_file.temporary_file_path()
+            return
+
+        # VideoCapture needs a path, so in-memory clips are spooled to disk.
+        suffix = os.path.splitext(video_file.name)[1] or '.mp4'
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as spooled:
+            for chunk in video_file.chunks():
+                spooled.write(chunk)
+        try:
+            yield 'video', spooled.name
+        finally:
+            os.unlink(spooled.name)
+        return
+
+    # Frames stay on disk (or in the upload buffer) until decoded one at a time.
+    frames = []
+    for frame_file in frame_files[:settings.SCAN_BURST_MAX_FRAMES]:
+        if frame_file.size > settings.SCAN_MAX_UPLOAD_BYTES:
+            raise ScanRejected('too_large')
+        if hasattr(frame_file, 'temporary_file_path'):
+            frames.append(frame_file.temporary_file_path())
+        else:
+            frames.append(frame_file)
+    yield 'frames', frames
+
+
+def analyze_burst_upload(frame_files, video_file):
+    from .ai_logic import analyze_burst_source
+
+    with burst_source(frame_files, video_file) as (kind, source):
+        return analyze_burst_source(kind, source)
+
+
+def create_burst_scan(user, raw_metrics, frame):
+    # The median is already robust, so burst results skip the 0.7/0.3 blend.
+    return create_completed_scan(user, frame, hash_buffer(frame), 'burst.jpg', raw_metrics, smooth=False)
+
+
+def warm_up_web_process():
+    global _warmed_up
+    with _warm_up_lock:
+        if _warmed_up or not settings.SCAN_WARM_UP:
+            return
+
+        # Preflight always runs in the web process, whatever the scan mode.
+        from .ai_logic import warm_up_preflight
+        warm_up_preflight()
+
+        if settings.SCAN_PROCESSING_MODE == 'pool':
+            from .pool import scan_process_pool
+            scan_process_pool().start()
+        elif settings.SCAN_PROCESSING_MODE == 'sync':
+            from .ai_logic import warm_up
+            warm_up()
+        _warmed_up = True
+
+
+def create_completed_scan(user, image_buffer, image_hash, image_name, raw_metrics, smooth=True):
+    with telemetry.timer('scan_stage_seconds', stage='db_write'), transaction.atomic():
+        aggregate = lock_scan_aggregates([user.pk])[user.pk]
+        if smooth:
+            metrics = blend_metrics(raw_metrics, aggregate.latest())
+        else:
+            metrics = {field: raw_metrics[field] for field in METRIC_FIELDS}
+
+        scan = FaceScan.objects.create(
+            user=user,
+            image=store_scan_image(image_buffer, image_hash, image_name),
+            image_hash=image_hash,
+            status='COMPLETED',
+            **metrics,
+            **scan_geometry(raw_metrics)
+        )
+        aggregate.record(metrics, scan.created_at)
+        aggregate.save()
+
+    with telemetry.timer('scan_stage_seconds', stage='goal_update'):
+        update_user_goal(user, metrics)
+    mark_dashboard_stale(user.pk)
+    update_leaderboard(user.pk)
+    return scan
+
+
+def complete_scan(scan, raw_metrics):
+    with telemetry.timer('scan_stage_seconds', stage='db_write'), transaction.atomic():
+        aggregate = lock_scan_aggregates([scan.user_id])[scan.user_id]
+        if not lock_claimed_scans([scan.pk], scan.claim_token):
+            # A newer attempt took the scan over, or it was reclaimed as stale.
+            return None
+        metrics = blend_metrics(raw_metrics, aggregate.latest())
+
+        scan.jawline_angle = metrics['jawline_angle']
+        scan.symmetry_score = metrics['symmetry_score']
+        scan.puffiness_index = metrics['puffiness_index']
+        for field, value in scan_geometry(raw_metrics).items():
+            setattr(scan, field, value)
+        scan.status = 'COMPLETED'
+        scan.error_message = None
+        scan.save()
+        aggregate.record(metrics, scan.created_at)
+        aggregate.save()
+
+    with telemetry.timer('scan_stage_seconds', stage='goal_update'):
+        update_user_goal(scan.user, metrics)
+    mark_dashboard_stale(scan.user_id)
+    update_leaderboard(scan.user_id)
+    return scan
@@ -1,50 +1,214 @@
-from celery import shared_task
-from django.core.files.base import ContentFile
-from .models import FaceScan, UserGoal
-from .ai_logic import analyze_face_image
+from datetime import timedelta
+from celery import current_app, shared_task
+from celery.signals import before_task_publish, task_prerun
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import FaceScan
+from .ingest import hash_buffer, open_scan_buffer
+from .metrics import BURST_FIELDS, GEOMETRY_FIELDS, METRIC_FIELDS, rejection_code
+from .services import (
+    analyze_with_cache, blend_metrics, claim_scans, complete_scan, lane_priority, lock_claimed_scans,
+    lock_scan_aggregates, priority_lane, save_scan_aggregates, scan_geometry, scan_lane, update_user_goals
+)
+from . import telemetry
+from workouts.dashboard import mark_dashboard_stale, mark_dashboards_stale
+from workouts.leaderboard import update_leaderboards
 import logging
+import time
+
+BATCH_UPDATE_FIELDS = ['status', 'error_message', 'image_hash', *METRIC_FIELDS, *GEOMETRY_FIELDS, *BURST_FIELDS]
+
+CV_TASKS = ('scans.tasks.process_face_scan', 'scans.tasks.process_face_scans_batch')
 
 logger = logging.getLogger(__name__)
 
-@shared_task
+
+@before_task_publish.connect
+def stamp_queued_at(sender=None, headers=None, properties=None, **kwargs):
+    if sender in CV_TASKS and headers is not None:
+        headers['queued_at'] = time.time()
+        headers['lane'] = priority_lane((properties or {}).get('priority') or 0)
+
+
+@task_prerun.connect
+def record_queue_wait(sender=None, task=None, **kwargs):
+    queued_at = getattr(task.request, 'queued_at', None)
+    if queued_at:
+        lane = getattr(task.request, 'lane', None) or 'default'
+        telemetry.observe('scan_queue_wait_seconds', max(0.0, time.time() - queued_at), lane=lane)
+
+
+def enqueue_scan(scan):
+    process_face_scan.apply_async((scan.id,), priority=lane_priority(scan_lane(scan.user_id)))
+
+
+@shared_task(acks_late=True)
 def process_face_scan(scan_id):
+    started = time.perf_counter()
+    outcome = 'error'
+    token = None
     try:
-        scan = FaceScan.objects.get(id=scan_id)
-        scan.status = 'PROCESSING'
-        scan.save()
+        token = claim_scans([scan_id])
+        scan = FaceScan.objects.select_related('user').filter(id=scan_id, claim_token=token).first()
+        if scan is None:
+            logger.info(f"Scan {scan_id} is missing or already handled; skipping.")
+            outcome = 'skipped'
+            return False
 
         with scan.image.open('rb') as img_file:
-            metrics = analyze_face_image(img_file)
-
-        scan.jawline_angle = metrics['jawline_angle']
-        scan.symmetry_score = metrics['symmetry_score']
-        scan.puffiness_index = metrics['puffiness_index']
-        scan.status = 'COMPLETED'
-        scan.save()
-
-        UserGoal.objects.update_or_create(
-            user=scan.user,
-            defaults={
-                'target_jawline': round(metrics['jawline_angle'] * 0.95, 1),
-                'target_symmetry': min(100, round(metrics['symmetry_score'] * 1.10, 1)),
-                'target_puffiness': round(metrics['puffiness_index'] * 0.90, 2)
-            }
-        )
+            with open_scan_buffer(img_file) as image_buffer:
+                if not scan.image_hash:
+                    scan.image_hash = hash_buffer(image_buffer)
+                    scan.save(update_fields=['image_hash'])
+                metrics = analyze_with_cache(image_buffer, scan.image_hash)
+
+        if complete_scan(scan, metrics) is None:
+            logger.info(f"Scan {scan_id} was taken over by another attempt; result discarded.")
+            outcome = 'superseded'
+            return False
 
         logger.info(f"Scan {scan_id} processed successfully.")
+        outcome = 'ok'
         return True
 
-    except FaceScan.DoesNotExist:
-        logger.error(f"Scan {scan_id} not found.")
-        return False
-        
     except Exception as e:
+        if isinstance(e, ValueError):
+            outcome = rejection_code(e)
         logger.error(f"Error processing scan {scan_id}: {str(e)}")
         try:
-            scan = FaceScan.objects.get(id=scan_id)
-            scan.status = 'FAILED'
-            scan.error_message = str(e)
-            scan.save()
+            if token is not None:
+                failed = FaceScan.objects.filter(id=scan_id, status='PROCESSING', claim_token=token)
+                user_id = failed.values_list('user_id', flat=True).first()
+                if failed.update(status='FAILED', error_message=str(e)):
+                    mark_dashboard_stale(user_id)
         except:
             pass
-        return False
\ No newline at end of file
+        return False
+
+    finally:
+        telemetry.observe('scan_task_seconds', time.perf_counter() - started, outcome=outcome)
+
+
+def _analyze_scan(scan):
+    try:
+        with scan.image.open('rb') as img_file:
+            with open_scan_buffer(img_file) as image_buffer:
+                if not scan.image_hash:
+                    scan.image_hash = hash_buffer(image_buffer)
+                return analyze_with_cache(image_buffer, scan.image_hash), None
+    except Exception as e:
+        return None, e
+
+
+@shared_task(acks_late=True)
+def process_face_scans_batch(scan_ids):
+    started = time.perf_counter()
+    token = claim_scans(scan_ids)
+    scans = list(FaceScan.objects.filter(id__in=scan_ids, claim_token=token).order_by('created_at'))
+    if not scans:
+        return 0
+
+    # Threads share this process's engine pool; cv2 and mediapipe release the GIL.
+    with ThreadPoolExecutor(max_workers=settings.FACE_MESH_POOL_SIZE) as executor:
+        results = list(executor.map(_analyze_scan, scans))
+
+    goals = {}
+    failed = 0
+
+    with telemetry.timer('scan_stage_seconds', stage='batch_write'):
+        with transaction.atomic():
+            aggregates = lock_scan_aggregates({scan.user_id for scan in scans})
+            # Scans another attempt took over since the claim are left to that attempt.
+            owned = lock_claimed_scans([scan.id for scan in scans], token)
+            outcomes = [(scan, result) for scan, result in zip(scans, results) if scan.id in owned]
+            scans = [scan for scan, _ in outcomes]
+
+            for scan, (raw_metrics, error) in outcomes:
+                if raw_metrics is None:
+                    logger.error(f"Error processing scan {scan.id}: {str(error)}")
+                    scan.status = 'FAILED'
+                    scan.error_message = str(error)
+                    failed += 1
+                    telemetry.increment('scan_batch_scans_total', outcome=rejection_code(error) if isinstance(error, ValueError) else 'error')
+                    continue
+
+                aggregate = aggregates[scan.user_id]
+                metrics = blend_metrics(raw_metrics, aggregate.latest())
+                aggregate.record(metrics, scan.created_at)
+                goals[scan.user_id] = metrics
+
+                for field, value in {**metrics, **scan_geometry(raw_metrics)}.items():
+                    setattr(scan, field, value)
+                scan.status = 'COMPLETED'
+                scan.error_message = None
+                telemetry.increment('scan_batch_scans_total', outcome='ok')
+
+            FaceScan.objects.bulk_update(scans, BATCH_UPDATE_FIELDS)
+            save_scan_aggregates([aggregates[user_id] for user_id in goals])
+            update_user_goals(goals)
+    mark_dashboards_stale(scan.user_id for scan in scans)
+    update_leaderboards(goals)
+
+    telemetry.observe('scan_batch_seconds', time.perf_counter() - started, outcome='ok')
+    logger.info(f"Batch of {len(scans)} scans processed, {failed} failed.")
+    return len(scans) - failed
+
+
+@shared_task
+def dispatch_pending_scans():
+    reclaimed = FaceScan.objects.filter(
+        status__in=('QUEUED', 'PROCESSING'),
+        status_changed_at__lt=timezone.now() - timedelta(seconds=settings.SCAN_STALE_AFTER)
+    ).update(status='PENDING', status_changed_at=timezone.now(), claim_token=None)
+    if reclaimed:
+        logger.warning(f"Reclaimed {reclaimed} stale queued or processing scans.")
+
+    dispatched = 0
+    for _ in range(settings.SCAN_DISPATCH_MAX_BATCHES):
+        with transaction.atomic():
+            claimed = list(
+                FaceScan.objects.select_for_update(skip_locked=True)
+                .filter(status='PENDING')
+                .order_by('created_at')
+                .values_list('id', 'user_id')[:settings.SCAN_BATCH_SIZE]
+            )
+            if not claimed:
+                break
+            FaceScan.objects.filter(id__in=[scan_id for scan_id, _ in claimed]).update(status='QUEUED', status_changed_at=timezone.now())
+            mark_dashboards_stale(user_id for _, user_id in claimed)
+
+            # Each lane gets its own batch so premium scans never wait behind a free user's chunk.
+            lanes = {user_id: scan_lane(user_id) for user_id in {user_id for _, user_id in claimed}}
+            by_lane = {}
+            for scan_id, user_id in claimed:
+                by_lane.setdefault(lanes[user_id], []).append(scan_id)
+            for lane, ids in by_lane.items():
+                process_face_scans_batch.apply_async((ids,), priority=lane_priority(lane))
+        dispatched += len(claimed)
+
+    if dispatched:
+        logger.info(f"Dispatched {dispatched} pending scans.")
+    return dispatched
+
+
+def lane_queue_key(priority):
+    # Mirrors kombu's Redis layout: priority 0 uses the bare queue, other steps get a suffixed list.
+    if not priority:
+        return settings.SCAN_QUEUE
+    sep = settings.CELERY_BROKER_TRANSPORT_OPTIONS['sep']
+    return f"{settings.SCAN_QUEUE}{sep}{priority}"
+
+
+@shared_task
+def record_scan_queue_depths():
+    depths = {}
+    with current_app.connection_for_read() as connection:
+        client = connection.default_channel.client
+        for lane, priority in settings.SCAN_LANE_PRIORITIES.items():
+            depths[lane] = client.llen(lane_queue_key(priority))
+
+    for lane, depth in depths.items():
+        telemetry.gauge('scan_queue_depth', depth, lane=lane)
+    return depths
@@ -0,0 +1,231 @@
+import bisect
+import logging
+import socket
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SEPARATOR = '\x1f'
+
+
+def _series(name, labels):
+    label_text = ','.join(f'{key}="{labels[key]}"' for key in sorted(labels))
+    return f"{name}{SEPARATOR}{label_text}"
+
+
+def _bucket_index(value, buckets=DEFAULT_BUCKETS):
+    return bisect.bisect_left(buckets, value)
+
+
+def render_prometheus(histograms, counters, gauges, buckets=DEFAULT_BUCKETS):
+    lines = []
+    by_name = defaultdict(list)
+    for series, data in histograms.items():
+        name, label_text = series.split(SEPARATOR)
+        by_name[name].append((label_text, data))
+
+    for name in sorted(by_name):
+        lines.append(f"# TYPE {name} histogram")
+        for label_text, data in sorted(by_name[name]):
+            prefix = f"{label_text}," if label_text else ""
+            cumulative = 0
+            for i, bound in enumerate(buckets):
+                cumulative += data['buckets'].get(i, 0)
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {data["count"]}')
+            suffix = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{name}_sum{suffix} {data['sum']}")
+            lines.append(f"{name}_count{suffix} {data['count']}")
+
+    for kind, values in (('counter', counters), ('gauge', gauges)):
+        seen = set()
+        for series in sorted(values):
+            name, label_text = series.split(SEPARATOR)
+            if name not in seen:
+                lines.append(f"# TYPE {name} {kind}")
+                seen.add(name)
+            suffix = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{name}{suffix} {values[series]}")
+
+    return "\n".join(lines) + "\n"
+
+
+class NullSink:
+    def observe(self, name, value, labels):
+        pass
+
+    def increment(self, name, value, labels):
+        pass
+
+    def gauge(self, name, value, labels):
+        pass
+
+
+class InMemorySink:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.histograms = defaultdict(lambda: {'buckets': defaultdict(int), 'sum': 0.0, 'count': 0})
+            self.counters = defaultdict(float)
+            self.gauges = {}
+
+    def observe(self, name, value, labels):
+        series = _series(name, labels)
+        with self._lock:
+            data = self.histograms[series]
+            data['buckets'][_bucket_index(value)] += 1
+            data['sum'] += value
+            data['count'] += 1
+
+    def increment(self, name, value, labels):
+        with self._lock:
+            self.counters[_series(name, labels)] += value
+
+    def gauge(self, name, value, labels):
+        with self._lock:
+            self.gauges[_series(name, labels)] = value
+
+    def render(self):
+        with self._lock:
+            return render_prometheus(self.histograms, self.counters, self.gauges)
+
+
+class PrometheusSink:
+    # Web, pool and Celery processes all write here so one scrape sees every worker.
+    HISTOGRAMS_KEY = 'telemetry:histograms'
+    COUNTERS_KEY = 'telemetry:counters'
+    GAUGES_KEY = 'telemetry:gauges'
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    def _client(self):
+        from django_redis import get_redis_connection
+        return get_redis_connection(self.alias)
+
+    def _send(self, build):
+        try:
+            pipe = self._client().pipeline(transaction=False)
+            build(pipe)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to record metric: {e}")
+
+    def observe(self, name, value, labels):
+        series = _series(name, labels)
+
+        def build(pipe):
+            pipe.hincrby(self.HISTOGRAMS_KEY, f"{series}{SEPARATOR}{_bucket_index(value)}", 1)
+            pipe.hincrbyfloat(self.HISTOGRAMS_KEY, f"{series}{SEPARATOR}sum", value)
+            pipe.hincrby(self.HISTOGRAMS_KEY, f"{series}{SEPARATOR}count", 1)
+
+        self._send(build)
+
+    def increment(self, name, value, labels):
+        self._send(lambda pipe: pipe.hincrbyfloat(self.COUNTERS_KEY, _series(name, labels), value))
+
+    def gauge(self, name, value, labels):
+        self._send(lambda pipe: pipe.hset(self.GAUGES_KEY, _series(name, labels), value))
+
+    def render(self):
+        client = self._client()
+        histograms = defaultdict(lambda: {'buckets': defaultdict(int), 'sum': 0.0, 'count': 0})
+        for field, value in client.hgetall(self.HISTOGRAMS_KEY).items():
+            name, label_text, slot = field.decode().split(SEPARATOR)
+            data = histograms[f"{name}{SEPARATOR}{label_text}"]
+            if slot == 'sum':
+                data['sum'] = float(value)
+            elif slot == 'count':
+                data['count'] = int(value)
+            else:
+                data['buckets'][int(slot)] = int(value)
+
+        counters = {field.decode(): float(value) for field, value in client.hgetall(self.COUNTERS_KEY).items()}
+        gauges = {field.decode(): float(value) for field, value in client.hgetall(self.GAUGES_KEY).items()}
+        return render_prometheus(histograms, counters, gauges)
+
+
+class StatsdSink:
+    def __init__(self, host, port, prefix):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    def _name(self, name, labels):
+        parts = [self.prefix, name] if self.prefix else [name]
+        parts += [str(labels[key]).replace('.', '_') for key in sorted(labels)]
+        return '.'.join(parts)
+
+    def _send(self, payload):
+        try:
+            self._socket.sendto(payload.encode(), self.address)
+        except OSError:
+            pass
+
+    def observe(self, name, value, labels):
+        self._send(f"{self._name(name, labels)}:{value * 1000:.3f}|ms")
+
+    def increment(self, name, value, labels):
+        self._send(f"{self._name(name, labels)}:{value}|c")
+
+    def gauge(self, name, value, labels):
+        self._send(f"{self._name(name, labels)}:{value}|g")
+
+
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+def build_sink(kind):
+    if kind == 'memory':
+        return InMemorySink()
+    if kind == 'prometheus':
+        return PrometheusSink()
+    if kind == 'statsd':
+        return StatsdSink(settings.STATSD_HOST, settings.STATSD_PORT, settings.STATSD_PREFIX)
+    return NullSink()
+
+
+def get_sink():
+    kind = settings.SCAN_METRICS_SINK
+    sink = _sinks.get(kind)
+    if sink is None:
+        with _sinks_lock:
+            sink = _sinks.get(kind)
+            if sink is None:
+                sink = build_sink(kind)
+                _sinks[kind] = sink
+    return sink
+
+
+def observe(name, value, **labels):
+    get_sink().observe(name, value, labels)
+
+
+def increment(name, value=1, **labels):
+    get_sink().increment(name, value, labels)
+
+
+def gauge(name, value, **labels):
+    get_sink().gauge(name, value, labels)
+
+
+@contextmanager
+def timer(name, **labels):
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        observe(name, time.perf_counter() - started, outcome=outcome, **labels)
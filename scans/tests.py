@@ -1,3 +1,167 @@
-from django.test import TestCase
+import numpy as np
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from .metrics import METRIC_FIELDS, compute_face_metrics
+
+LANDMARK_COUNT = 478
+FACE_LAYOUT = {
+    1: (0.50, 0.55), 168: (0.50, 0.40), 152: (0.50, 0.80),
+    33: (0.40, 0.42), 263: (0.60, 0.42), 133: (0.45, 0.42), 362: (0.55, 0.42),
+    61: (0.44, 0.68), 291: (0.56, 0.68), 234: (0.30, 0.50), 454: (0.70, 0.50),
+    172: (0.36, 0.70), 397: (0.64, 0.70), 177: (0.33, 0.60), 401: (0.67, 0.60),
+}
+
+
+def calculate_angle(a, b, c):
+    ba = np.array(a) - np.array(b)
+    bc = np.array(c) - np.array(b)
+
+    denom = np.linalg.norm(ba) * np.linalg.norm(bc)
+    if denom == 0:
+        return 0.0
+
+    cosine_angle = np.dot(ba, bc) / denom
+    angle = np.arccos(np.clip(cosine_angle, -1.0, 1.0))
+    return np.degrees(angle)
+
+
+def get_distance(p1, p2):
+    return np.linalg.norm(np.array(p1) - np.array(p2))
+
+
+def legacy_metrics(points, width, height):
+    # The per-landmark math compute_face_metrics replaced, kept as the reference.
+    landmarks = [(float(x), float(y)) for x, y, _ in points]
+
+    left_dist = abs(landmarks[1][0] - landmarks[234][0])
+    right_dist = abs(landmarks[1][0] - landmarks[454][0])
+    x_values = [x for x, _ in landmarks]
+    y_values = [y for _, y in landmarks]
+    min_x, max_x = min(x_values), max(x_values)
+    min_y, max_y = min(y_values), max(y_values)
+
+    rejection = None
+    if right_dist > 0 and not 0.5 <= left_dist / right_dist <= 2.0:
+        rejection = 'not_frontal'
+    elif abs(landmarks[33][1] - landmarks[263][1]) > 0.1:
+        rejection = 'not_level'
+    elif min_x < 0.01 or max_x > 0.99 or min_y < 0.01 or max_y > 0.99:
+        rejection = 'too_close'
+    elif max_x - min_x < 0.20:
+        rejection = 'too_far'
+
+    def get_coords(index):
+        return (landmarks[index][0] * width, landmarks[index][1] * height)
+
+    left_jaw_angle = calculate_angle(get_coords(177), get_coords(172), get_coords(152))
+    right_jaw_angle = calculate_angle(get_coords(401), get_coords(397), get_coords(152))
+
+    total_deviation = 0
+    mid_x = get_coords(168)[0]
+    pairs = [(33, 263), (133, 362), (61, 291), (234, 454), (172, 397)]
+    for left_idx, right_idx in pairs:
+        l_dist = abs(mid_x - get_coords(left_idx)[0])
+        r_dist = abs(get_coords(right_idx)[0] - mid_x)
+        denominator = (l_dist + r_dist) / 2
+        if denominator > 0:
+            total_deviation += abs(l_dist - r_dist) / denominator
+
+    cheek_width = get_distance(get_coords(234), get_coords(454))
+    jaw_width = get_distance(get_coords(172), get_coords(397))
+    puffiness_index = cheek_width / jaw_width if jaw_width > 0 else 1.0
+
+    return {
+        'jawline_angle': round((left_jaw_angle + right_jaw_angle) / 2, 1),
+        'symmetry_score': round(max(10, 100 - (total_deviation / len(pairs) * 50)), 1),
+        'puffiness_index': round(max(0.1, puffiness_index - 1.0), 2),
+        'rejection': rejection,
+    }
+
+
+def make_face(rng, jitter=0.01):
+    points = np.empty((LANDMARK_COUNT, 3), dtype=np.float32)
+    points[:, 0] = rng.uniform(0.32, 0.68, LANDMARK_COUNT)
+    points[:, 1] = rng.uniform(0.30, 0.78, LANDMARK_COUNT)
+    points[:, 2] = rng.normal(0, 0.02, LANDMARK_COUNT)
+    for index, (x, y) in FACE_LAYOUT.items():
+        points[index, :2] = (x, y)
+    points[list(FACE_LAYOUT), :2] += rng.normal(0, jitter, (len(FACE_LAYOUT), 2))
+    return points
+
+
+class ComputeFaceMetricsTests(SimpleTestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(7)
+
+    def assertMatchesLegacy(self, result, expected):
+        self.assertEqual(result['rejection'], expected['rejection'])
+        for field in METRIC_FIELDS:
+            self.assertEqual(result[field], expected[field], msg=field)
+
+    def test_single_face_matches_legacy_math(self):
+        for width, height in ((640, 480), (1080, 1920), (250, 290)):
+            for _ in range(20):
+                points = make_face(self.rng)
+                self.assertMatchesLegacy(compute_face_metrics(points, width, height), legacy_metrics(points, width, height))
+
+    def test_single_face_returns_plain_values(self):
+        result = compute_face_metrics(make_face(self.rng), 640, 480)
+        for field in METRIC_FIELDS:
+            self.assertIs(type(result[field]), float)
+        self.assertIsNone(result['rejection'])
+
+    def test_batch_matches_single_faces(self):
+        faces = np.stack([make_face(self.rng) for _ in range(12)])
+        widths = self.rng.integers(200, 2000, len(faces))
+        heights = self.rng.integers(200, 2000, len(faces))
+
+        batch = compute_face_metrics(faces, widths, heights)
+        self.assertEqual(batch['jawline_angle'].shape, (len(faces),))
+        for i, points in enumerate(faces):
+            single = compute_face_metrics(points, widths[i], heights[i])
+            self.assertEqual(batch['rejection'][i], single['rejection'])
+            for field in METRIC_FIELDS:
+                self.assertEqual(float(batch[field][i]), single[field])
+            self.assertMatchesLegacy(single, legacy_metrics(points, widths[i], heights[i]))
+
+    def test_batch_broadcasts_scalar_size(self):
+        faces = np.stack([make_face(self.rng) for _ in range(3)])
+        batch = compute_face_metrics(faces, 640, 480)
+        for i, points in enumerate(faces):
+            self.assertEqual(float(batch['symmetry_score'][i]), compute_face_metrics(points, 640, 480)['symmetry_score'])
+
+    def test_pose_rejections(self):
+        turned = make_face(self.rng)
+        turned[1, 0] = 0.36
+
+        tilted = make_face(self.rng)
+        tilted[33, 1] += 0.15
+
+        close = make_face(self.rng)
+        close[10, 0] = 0.005
+
+        far = make_face(self.rng)
+        far[:, :2] = 0.5 + (far[:, :2] - 0.5) * 0.4
+
+        # A face failing several checks reports the first one, in the legacy order.
+        turned_and_tilted = turned.copy()
+        turned_and_tilted[33, 1] += 0.15
+
+        cases = {
+            'not_frontal': turned, 'not_level': tilted, 'too_close': close, 'too_far': far,
+        }
+        for code, points in cases.items():
+            with self.subTest(code=code):
+                self.assertEqual(compute_face_metrics(points, 640, 480)['rejection'], code)
+                self.assertMatchesLegacy(compute_face_metrics(points, 640, 480), legacy_metrics(points, 640, 480))
+        self.assertEqual(compute_face_metrics(turned_and_tilted, 640, 480)['rejection'], 'not_frontal')
+
+        batch = compute_face_metrics(np.stack([make_face(self.rng), *cases.values()]), 640, 480)
+        self.assertEqual(batch['rejection'], [None, *cases])
+
+    def test_degenerate_jaw_has_zero_angle(self):
+        points = make_face(self.rng)
+        points[177, :2] = points[172, :2]
+        points[401, :2] = points[397, :2]
+        self.assertEqual(compute_face_metrics(points, 640, 480)['jawline_angle'], 0.0)
+        self.assertEqual(legacy_metrics(points, 640, 480)['jawline_angle'], 0.0)
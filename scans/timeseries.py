@@ -0,0 +1,55 @@
+from datetime import datetime, timezone
+
+import numpy as np
+from .metrics import METRIC_DIGITS, METRIC_FIELDS
+
+
+def bucket_bounds(timestamps, start, end, points):
+    # Equal-width time buckets; timestamps are sorted, so each bucket is a contiguous run.
+    width = max(end - start, 1e-9) / points
+    index = np.minimum(((timestamps - start) / width).astype(np.int64), points - 1)
+    starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+    return starts, np.diff(np.r_[starts, len(timestamps)])
+
+
+def downsample(timestamps, values, start, end, points):
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+
+    if not len(timestamps):
+        empty = np.empty((0, values.shape[1]))
+        return np.empty(0), np.empty(0, dtype=np.int64), empty, empty, empty
+
+    if len(timestamps) <= points:
+        return timestamps, np.ones(len(timestamps), dtype=np.int64), values, values, values
+
+    starts, counts = bucket_bounds(timestamps, start, end, points)
+    mean_time = np.add.reduceat(timestamps, starts) / counts
+    mean = np.add.reduceat(values, starts, axis=0) / counts[:, np.newaxis]
+    low = np.minimum.reduceat(values, starts, axis=0)
+    high = np.maximum.reduceat(values, starts, axis=0)
+    return mean_time, counts, mean, low, high
+
+
+def metric_series(rows, start, end, points):
+    if rows:
+        created, *columns = zip(*rows)
+        timestamps = np.fromiter((moment.timestamp() for moment in created), dtype=np.float64, count=len(created))
+        values = np.array(columns, dtype=np.float64).T
+    else:
+        timestamps, values = np.empty(0), np.empty((0, len(METRIC_FIELDS)))
+
+    times, counts, mean, low, high = downsample(timestamps, values, start, end, points)
+
+    series = {
+        'timestamps': [datetime.fromtimestamp(moment, timezone.utc) for moment in times.tolist()],
+        'count': counts.tolist(),
+    }
+    for i, field in enumerate(METRIC_FIELDS):
+        digits = METRIC_DIGITS[field]
+        series[field] = {
+            'mean': np.round(mean[:, i], digits).tolist(),
+            'min': np.round(low[:, i], digits).tolist(),
+            'max': np.round(high[:, i], digits).tolist(),
+        }
+    return series
@@ -1,7 +1,14 @@
 from django.urls import path
-from .views import ScanFaceView, SetGoalsView
+from .views import (
+    ScanBurstView, ScanFaceView, ScanMetricsView, ScanPreflightView, ScanStatusView, ScanTimeSeriesView, SetGoalsView
+)
 
 urlpatterns = [
     path('analyze/', ScanFaceView.as_view(), name='scan-face'),
+    path('burst/', ScanBurstView.as_view(), name='scan-burst'),
+    path('preflight/', ScanPreflightView.as_view(), name='scan-preflight'),
+    path('<int:scan_id>/status/', ScanStatusView.as_view(), name='scan-status'),
+    path('timeseries/', ScanTimeSeriesView.as_view(), name='scan-timeseries'),
     path('set-goals/', SetGoalsView.as_view(), name='set-goals'),
+    path('metrics/', ScanMetricsView.as_view(), name='scan-metrics'),
 ]
\ No newline at end of file
@@ -1,23 +1,40 @@
 from rest_framework.views import APIView
+from adrf.views import APIView as AsyncAPIView
+from asgiref.sync import sync_to_async
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.throttling import UserRateThrottle
+from django.http import HttpResponse
 from django.utils import timezone
+from datetime import timedelta
 from .models import FaceScan, UserGoal
 from .serializers import FaceScanSerializer, SetGoalsSerializer
+from workouts.dashboard import mark_dashboard_stale
 from workouts.utils import generate_workout_plan
 from payments.services import verify_subscription_status
-from .ai_logic import analyze_face_image 
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
-from django.views.decorators.vary import vary_on_headers
+from .ingest import hash_buffer, open_scan_buffer, store_scan_image
+from .pool import PoolSaturated, scan_process_pool
+from .services import (
+    SCAN_PROGRESS, analyze_and_cache, analyze_burst_upload, burst_source, cache_rejection, cache_result,
+    create_burst_scan, create_completed_scan, get_cached_result, preflight_scan, raise_for_cached
+)
+from .metrics import METRIC_FIELDS, rejection_code
+from .timeseries import metric_series
+from .tasks import enqueue_scan
+from . import telemetry
+from django.conf import settings
+from facebuilder.cache import cache_user_response
+import time
 
-class ScanFaceView(APIView):
+class ScanFaceView(AsyncAPIView):
     permission_classes = [IsAuthenticated]
 
-    @method_decorator(cache_page(60 * 1))
-    @method_decorator(vary_on_headers('Authorization'))
-    def get(self, request):
+    async def get(self, request):
+        return await sync_to_async(self.latest_scan)(request)
+
+    @cache_user_response('latest_scan')
+    def latest_scan(self, request):
         scan = FaceScan.objects.filter(user=request.user).order_by('-created_at').first()
         if not scan:
             return Response({"message": "No scans found"}, status=status.HTTP_404_NOT_FOUND)
@@ -25,47 +42,129 @@ class ScanFaceView(APIView):
         serializer_data = FaceScanSerializer(scan, context={'request': request}).data
         return Response(serializer_data, status=status.HTTP_200_OK)
 
-    def post(self, request):
+    async def post(self, request):
         if 'image' not in request.FILES:
             return Response({"error": "No image provided"}, status=status.HTTP_400_BAD_REQUEST)
 
         image_file = request.FILES['image']
-        
+        mode = settings.SCAN_PROCESSING_MODE
+        started = time.perf_counter()
+
+        if mode == 'pool':
+            response = await self.process_in_pool(request, image_file)
+        else:
+            response = await sync_to_async(self.process_upload)(request, image_file)
+
+        telemetry.observe('scan_request_seconds', time.perf_counter() - started, mode=mode, status=response.status_code)
+        return response
+
+    def scan_created(self, request, scan):
+        serializer_data = FaceScanSerializer(scan, context={'request': request}).data
+
+        return Response({
+            "message": "Scan complete.",
+            "scan_data": serializer_data
+        }, status=status.HTTP_201_CREATED)
+
+    def process_upload(self, request, image_file):
         try:
-            new_metrics = analyze_face_image(image_file)
-            
-            last_scan = FaceScan.objects.filter(
-                user=request.user, 
-                status='COMPLETED'
-            ).exclude(jawline_angle__isnull=True).order_by('-created_at').first()
-            
-            final_jawline = new_metrics['jawline_angle']
-            final_symmetry = new_metrics['symmetry_score']
-            final_puffiness = new_metrics['puffiness_index']
-
-            if last_scan:
-                final_jawline = (final_jawline * 0.7) + (last_scan.jawline_angle * 0.3)
-                final_symmetry = (final_symmetry * 0.7) + (last_scan.symmetry_score * 0.3)
-                final_puffiness = (final_puffiness * 0.7) + (last_scan.puffiness_index * 0.3)
-
-            image_file.seek(0)
-            scan = FaceScan.objects.create(
-                user=request.user,
-                image=image_file,
-                status='COMPLETED',
-                jawline_angle=round(final_jawline, 1),
-                symmetry_score=round(final_symmetry, 1),
-                puffiness_index=round(final_puffiness, 2)
-            )
-            UserGoal.objects.update_or_create(
-                user=request.user,
-                defaults={
-                    'target_jawline': round(final_jawline * 0.95, 1),
-                    'target_symmetry': min(100, round(final_symmetry * 1.10, 1)),                   
-                    'target_puffiness': 0.20
-                }
-            )
+            with open_scan_buffer(image_file) as image_buffer:
+                image_hash = hash_buffer(image_buffer)
+                cached = get_cached_result(image_hash)
+
+                if settings.SCAN_PROCESSING_MODE == 'celery' and cached is None:
+                    scan = FaceScan.objects.create(
+                        user=request.user,
+                        image=store_scan_image(image_buffer, image_hash, image_file.name),
+                        image_hash=image_hash,
+                        status='QUEUED'
+                    )
+                    enqueue_scan(scan)
+                    mark_dashboard_stale(request.user.id)
+
+                    return Response({
+                        "message": "Scan queued.",
+                        "scan_id": scan.id,
+                        "status": scan.status
+                    }, status=status.HTTP_202_ACCEPTED)
+
+                if cached is not None:
+                    new_metrics = raise_for_cached(cached)
+                else:
+                    new_metrics = analyze_and_cache(image_buffer, image_hash)
+
+                scan = create_completed_scan(request.user, image_buffer, image_hash, image_file.name, new_metrics)
+
+            return self.scan_created(request, scan)
+
+        except ValueError as e:
+            return Response({
+                "error": str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
             
+        except Exception as e:
+            return Response({"error": "Processing failed", "details": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    async def process_in_pool(self, request, image_file):
+        try:
+            with open_scan_buffer(image_file) as image_buffer:
+                image_hash = await sync_to_async(hash_buffer, thread_sensitive=False)(image_buffer)
+                cached = await sync_to_async(get_cached_result, thread_sensitive=False)(image_hash)
+
+                if cached is not None:
+                    new_metrics = raise_for_cached(cached)
+                else:
+                    try:
+                        new_metrics = await scan_process_pool().analyze(image_file, image_buffer)
+                    except ValueError as e:
+                        await sync_to_async(cache_rejection, thread_sensitive=False)(image_hash, e)
+                        raise
+                    await sync_to_async(cache_result, thread_sensitive=False)(image_hash, metrics=new_metrics)
+
+                scan = await sync_to_async(create_completed_scan)(
+                    request.user, image_buffer, image_hash, image_file.name, new_metrics
+                )
+
+            return self.scan_created(request, scan)
+
+        except PoolSaturated:
+            return Response({
+                "error": "Scan service is busy. Please try again shortly."
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        except ValueError as e:
+            return Response({
+                "error": str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        except Exception as e:
+            return Response({"error": "Processing failed", "details": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ScanBurstView(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+
+    async def post(self, request):
+        frame_files = request.FILES.getlist('frames')
+        video_file = request.FILES.get('video')
+
+        if bool(frame_files) == bool(video_file):
+            return Response({"error": "Provide either frames or a video"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(frame_files) > settings.SCAN_BURST_MAX_FRAMES:
+            return Response({
+                "error": f"A burst can have at most {settings.SCAN_BURST_MAX_FRAMES} frames"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            if settings.SCAN_PROCESSING_MODE == 'pool':
+                with burst_source(frame_files, video_file) as (kind, source):
+                    raw_metrics, frame = await scan_process_pool().analyze_burst(kind, source)
+            else:
+                raw_metrics, frame = await sync_to_async(analyze_burst_upload, thread_sensitive=False)(
+                    frame_files, video_file
+                )
+
+            scan = await sync_to_async(create_burst_scan)(request.user, raw_metrics, frame)
             serializer_data = FaceScanSerializer(scan, context={'request': request}).data
 
             return Response({
@@ -73,15 +172,135 @@ class ScanFaceView(APIView):
                 "scan_data": serializer_data
             }, status=status.HTTP_201_CREATED)
 
+        except PoolSaturated:
+            return Response({
+                "error": "Scan service is busy. Please try again shortly."
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
         except ValueError as e:
             return Response({
                 "error": str(e)
             }, status=status.HTTP_400_BAD_REQUEST)
-            
+
         except Exception as e:
             return Response({"error": "Processing failed", "details": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class PreflightThrottle(UserRateThrottle):
+    scope = 'preflight'
+
+
+class ScanPreflightView(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [PreflightThrottle]
+
+    async def post(self, request):
+        if 'image' not in request.FILES:
+            return Response({"error": "No image provided"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            await sync_to_async(preflight_scan, thread_sensitive=False)(request.FILES['image'])
+        except ValueError as e:
+            return Response({
+                "message": str(e),
+                "ready": False,
+                "reason": rejection_code(e)
+            }, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({"error": "Preflight failed", "details": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response({"message": "Ready to scan.", "ready": True}, status=status.HTTP_200_OK)
+
+
+class ScanStatusView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, scan_id):
+        scan = FaceScan.objects.filter(id=scan_id, user=request.user).values(
+            'id', 'status', 'error_message', 'jawline_angle', 'symmetry_score', 'puffiness_index'
+        ).first()
+        if not scan:
+            return Response({"error": "Scan not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        data = {
+            "scan_id": scan['id'],
+            "status": scan['status'],
+            "progress": SCAN_PROGRESS.get(scan['status'], 0),
+        }
+        if scan['status'] == 'COMPLETED':
+            data["metrics"] = {
+                "jawline_angle": scan['jawline_angle'],
+                "symmetry_score": scan['symmetry_score'],
+                "puffiness_index": scan['puffiness_index']
+            }
+        elif scan['status'] == 'FAILED':
+            data["error_message"] = scan['error_message']
+
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class ScanTimeSeriesView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        if not verify_subscription_status(request.user):
+            return Response({"error": "PAYMENT_REQUIRED"}, status=status.HTTP_402_PAYMENT_REQUIRED)
+
+        try:
+            points = int(request.query_params.get('points', settings.SCAN_TIMESERIES_DEFAULT_POINTS))
+            days = int(request.query_params['days']) if request.query_params.get('days') else None
+        except ValueError:
+            return Response({"error": "points and days must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not 1 <= points <= settings.SCAN_TIMESERIES_MAX_POINTS:
+            return Response(
+                {"error": f"points must be between 1 and {settings.SCAN_TIMESERIES_MAX_POINTS}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if days is not None and not 1 <= days <= settings.SCAN_TIMESERIES_MAX_DAYS:
+            return Response(
+                {"error": f"days must be between 1 and {settings.SCAN_TIMESERIES_MAX_DAYS}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        end = timezone.now()
+        scans = FaceScan.objects.filter(user=request.user, status='COMPLETED').exclude(jawline_angle__isnull=True)
+        if days:
+            start = end - timedelta(days=days)
+            scans = scans.filter(created_at__gte=start)
+
+        rows = list(scans.order_by('created_at').values_list('created_at', *METRIC_FIELDS))
+        if not days:
+            start = rows[0][0] if rows else end
+
+        series = metric_series(rows, start.timestamp(), end.timestamp(), points)
+        return Response({
+            "start": start,
+            "end": end,
+            "total_scans": len(rows),
+            "points": len(series['count']),
+            "series": series
+        }, status=status.HTTP_200_OK)
+
+
+class ScanMetricsView(APIView):
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        auth_header = request.headers.get('Authorization')
+        expected_token = f"Bearer {settings.SCAN_METRICS_TOKEN}"
+
+        if not settings.DEBUG and (not settings.SCAN_METRICS_TOKEN or auth_header != expected_token):
+            return Response({"error": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED)
+
+        sink = telemetry.get_sink()
+        if not hasattr(sink, 'render'):
+            return Response({"error": "Metrics are exported via statsd."}, status=status.HTTP_404_NOT_FOUND)
+
+        return HttpResponse(sink.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 class SetGoalsView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -93,6 +312,7 @@ class SetGoalsView(APIView):
             goal.wants_reduce_puffiness = serializer.data['wants_reduce_puffiness']
             goal.wants_improve_symmetry = serializer.data['wants_improve_symmetry']
             goal.save()
+            mark_dashboard_stale(request.user.id)
 
             latest_scan = FaceScan.objects.filter(user=request.user, status='COMPLETED').order_by('-created_at').first()
             
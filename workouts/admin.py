@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Exercise, WorkoutPlan, PlanExercise, WorkoutSession
+from .models import DashboardSnapshot, Exercise, WorkoutPlan, PlanExercise, WorkoutSession
 
 class PlanExerciseInline(admin.TabularInline):
     model = PlanExercise
@@ -18,6 +18,12 @@ class WorkoutPlanAdmin(admin.ModelAdmin):
     search_fields = ('user__phone_number',)
     inlines = [PlanExerciseInline]
 
+@admin.register(DashboardSnapshot)
+class DashboardSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('user', 'computed_for', 'is_stale', 'updated_at')
+    list_filter = ('is_stale',)
+    search_fields = ('user__phone_number',)
+
 @admin.register(WorkoutSession)
 class WorkoutSessionAdmin(admin.ModelAdmin):
     list_display = ('user', 'date_completed')
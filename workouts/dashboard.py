@@ -0,0 +1,194 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from facebuilder.cache import bump_user_cache_versions
+from scans.models import FaceScan, UserGoal
+from scans.serializers import FaceScanSerializer
+from .leaderboard import leaderboard_score, leaderboard_standing
+from .models import DashboardSnapshot, WorkoutStreak
+from .streaks import build_streak, local_today, user_timezone
+
+
+def dashboard_cache_key(user_id):
+    return f"dashboard:{user_id}"
+
+
+def build_dashboard(user):
+    from scans.services import get_scan_aggregate
+
+    streak_state = WorkoutStreak.objects.filter(user=user).first()
+    if streak_state is None:
+        streak_state = build_streak(user.pk)
+        WorkoutStreak.objects.bulk_create([streak_state], ignore_conflicts=True)
+    today = local_today(streak_state.timezone)
+    streak = streak_state.streak_on(today)
+
+    # Only the most recent scans are embedded so the snapshot stays a fixed size; full history is served
+    # downsampled by /api/scans/timeseries/.
+    recent_scans = FaceScan.objects.filter(user=user).defer('landmarks').order_by('-created_at')[:settings.DASHBOARD_GRAPH_SCANS]
+    scan_data = FaceScanSerializer(reversed(list(recent_scans)), many=True).data
+
+    aggregate = get_scan_aggregate(user.id)
+    latest_scan = aggregate.latest()
+    first_scan = aggregate.baseline()
+    goal = UserGoal.objects.filter(user=user).first()
+    
+    progress_summary = {
+        "overall_progress": 0,
+        "jawline_status": "Pending",
+        "goals_hit": []
+    }
+
+    comparison_text = "Analysis pending more data."
+    consistency_text = "Consistency shapes results."
+    next_badge_days = streak_state.days_to_next_badge(today)
+
+    if streak == 0:
+        consistency_text = "The best time to start is now. Let's do this!"
+    elif streak <= 3:
+        consistency_text = "Momentum is building! Keep this streak alive."
+    elif streak < 7:
+        consistency_text = "You are forming a powerful habit. Great work!"
+    else:
+        consistency_text = "Unstoppable! Your consistency is in the top 1%."
+
+    if latest_scan and goal:
+        current_val = latest_scan['jawline_angle'] if latest_scan['jawline_angle'] is not None else 0
+        target_val = goal.target_jawline if goal.target_jawline is not None else 0
+        
+        progress_summary['jawline_status'] = f"{int(current_val)}° (Goal {int(target_val)}°)"
+        
+        start_val = first_scan['jawline_angle'] if (first_scan and first_scan['jawline_angle']) else current_val
+        
+        total_journey = start_val - target_val
+        made_journey = start_val - current_val
+        
+        percent_complete = 0
+        if abs(total_journey) > 0.1: 
+            percent_complete = (made_journey / total_journey) * 100
+            percent_complete = max(0, min(100, percent_complete))
+        else:
+            percent_complete = 100 if current_val <= target_val else 0
+
+        progress_summary['overall_progress'] = int(percent_complete)
+        
+        progress_summary['goals_hit'].append({
+            "title": "Sharper Jawline",
+            "status": f"{int(percent_complete)}% complete",
+            "target": f"Goal {int(target_val)}°"
+        })
+        
+        if streak >= 7:
+             progress_summary['goals_hit'].append({
+                "title": "Consistency Master",
+                "status": "On Track",
+                "target": "Keep going"
+            })
+
+        if first_scan and latest_scan:
+            if aggregate.scan_count == 1:
+                comparison_text = "Baseline established. Your next scan will reveal your progress."
+            else:
+                diff = start_val - current_val
+                if diff > 0.5:
+                    imp_score = (diff / start_val) * 100 * 4 
+                    comparison_text = f"Your face is {int(imp_score)}% more defined than your first scan - keep it up!"
+                elif diff > -0.5:
+                     comparison_text = "You are maintaining your baseline perfectly. Increase intensity for more definition."
+                else:
+                     comparison_text = "Slight regression detected. Focus on posture and tongue position during exercises."
+
+    badges = []
+    if streak > 0:
+        badges.append(f"Day {streak} Complete")
+    
+    user_score = leaderboard_score(streak, latest_scan['symmetry_score'] if latest_scan else 0)
+    
+    # Ranks are filled in at read time by get_dashboard.
+    leaderboard_data = {"your_score": user_score}
+
+    return {
+        "streak_days": streak,
+        "next_badge_in_days": next_badge_days,
+        "consistency_text": consistency_text,
+        "comparison_text": comparison_text,
+        "graph_data": scan_data,
+        "progress_summary": progress_summary, 
+        "leaderboard": leaderboard_data,      
+        "badges": badges 
+    }
+
+
+def cache_dashboard(user_id, tz_name, today, data):
+    cache.set(
+        dashboard_cache_key(user_id),
+        {'timezone': tz_name, 'day': today.isoformat(), 'data': data},
+        timeout=settings.DASHBOARD_CACHE_TTL
+    )
+
+
+def refresh_dashboard(user):
+    tz_name = user_timezone(user)
+    today = local_today(tz_name)
+    snapshot, _ = DashboardSnapshot.objects.get_or_create(user=user)
+    generation = snapshot.generation
+    data = build_dashboard(user)
+
+    # A change that lands while we build bumps the generation, so this result is not marked fresh.
+    fresh = DashboardSnapshot.objects.filter(pk=snapshot.pk, generation=generation).update(
+        data=data,
+        computed_for=today,
+        is_stale=False,
+        updated_at=timezone.now()
+    )
+    if fresh:
+        cache_dashboard(user.pk, tz_name, today, data)
+    return data
+
+
+def load_dashboard(user):
+    # The streak depends on the user's local date, so a snapshot only lives until their midnight.
+    cached = cache.get(dashboard_cache_key(user.pk))
+    if cached is not None and cached['day'] == local_today(cached['timezone']).isoformat():
+        return cached['data']
+
+    tz_name = user_timezone(user)
+    today = local_today(tz_name)
+    snapshot = DashboardSnapshot.objects.filter(user=user).first()
+    if snapshot is not None and not snapshot.is_stale and snapshot.computed_for == today:
+        cache_dashboard(user.pk, tz_name, today, snapshot.data)
+        return snapshot.data
+
+    # Stale, missing or from an earlier day: rebuild inline.
+    return refresh_dashboard(user)
+
+
+def get_dashboard(user):
+    data = load_dashboard(user)
+    # Ranks move whenever anyone else scores, so they are read live rather than snapshotted.
+    leaderboard = leaderboard_standing(user.pk, 'weekly', data['leaderboard']['your_score'])
+    return {**data, 'leaderboard': leaderboard}
+
+
+def mark_dashboards_stale(user_ids):
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+
+    DashboardSnapshot.objects.filter(user_id__in=user_ids).update(is_stale=True, generation=F('generation') + 1)
+    cache.delete_many([dashboard_cache_key(user_id) for user_id in user_ids])
+    # Every write that stales the dashboard also changes the scan and plan payloads.
+    bump_user_cache_versions(user_ids)
+
+    def schedule():
+        from .tasks import rebuild_dashboard_snapshot
+        for user_id in user_ids:
+            rebuild_dashboard_snapshot.delay(user_id)
+
+    transaction.on_commit(schedule)
+
+
+def mark_dashboard_stale(user_id):
+    mark_dashboards_stale([user_id])
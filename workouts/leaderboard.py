@@ -0,0 +1,138 @@
+import datetime
+import logging
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from .models import WorkoutStreak
+from .streaks import local_today
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ('daily', 'weekly')
+PERIOD_LENGTH = {'daily': datetime.timedelta(days=1), 'weekly': datetime.timedelta(weeks=1)}
+# Buckets outlive their period by one more so the next one can report a trend against them.
+PERIOD_TTL = {period: int(length.total_seconds()) * 2 + 3600 for period, length in PERIOD_LENGTH.items()}
+WINDOW_READ_ATTEMPTS = 3
+
+
+def _client():
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+
+def bucket_key(period, day):
+    if period == 'weekly':
+        year, week, _ = day.isocalendar()
+        return f"leaderboard:weekly:{year}-W{week:02d}"
+    return f"leaderboard:daily:{day.isoformat()}"
+
+
+def leaderboard_score(streak, symmetry_score):
+    return streak * 10 + int(symmetry_score or 0)
+
+
+def current_scores(user_ids):
+    from scans.services import get_scan_aggregate
+
+    streaks = {streak.user_id: streak for streak in WorkoutStreak.objects.filter(user_id__in=user_ids)}
+    scores = {}
+    for user_id in user_ids:
+        streak = streaks.get(user_id)
+        days = streak.streak_on(local_today(streak.timezone)) if streak else 0
+        latest = get_scan_aggregate(user_id).latest()
+        scores[user_id] = leaderboard_score(days, latest['symmetry_score'] if latest else 0)
+    return scores
+
+
+def record_scores(scores, day=None):
+    day = day or timezone.localdate()
+    try:
+        pipe = _client().pipeline(transaction=False)
+        for period in PERIODS:
+            key = bucket_key(period, day)
+            pipe.zadd(key, scores)
+            pipe.expire(key, PERIOD_TTL[period])
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to update leaderboards: {e}")
+
+
+def update_leaderboards(user_ids):
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    # Scores read the committed streak and scan aggregate.
+    transaction.on_commit(lambda: record_scores(current_scores(user_ids)))
+
+
+def update_leaderboard(user_id):
+    update_leaderboards([user_id])
+
+
+def read_window(client, key, user_id):
+    from redis.exceptions import WatchError
+
+    # The window is sliced around the rank, so both are read under WATCH and retried if a score lands in between.
+    with client.pipeline() as pipe:
+        for attempt in range(WINDOW_READ_ATTEMPTS):
+            try:
+                pipe.watch(key)
+                rank = pipe.zrevrank(key, user_id)
+                start = max(0, (rank or 0) - settings.LEADERBOARD_WINDOW)
+                pipe.multi()
+                pipe.zcard(key)
+                if rank is not None:
+                    pipe.zrevrange(key, start, rank + settings.LEADERBOARD_WINDOW, withscores=True)
+                results = pipe.execute()
+            except WatchError:
+                if attempt == WINDOW_READ_ATTEMPTS - 1:
+                    raise
+                continue
+            return rank, start, results[0], results[1] if rank is not None else []
+
+
+def leaderboard_standing(user_id, period='weekly', your_score=None, day=None):
+    day = day or timezone.localdate()
+    standing = {"period": period, "your_rank": None, "your_score": your_score, "total": 0, "competitors": []}
+
+    key = bucket_key(period, day)
+    previous_key = bucket_key(period, day - PERIOD_LENGTH[period])
+    client = _client()
+    try:
+        rank, start, total, entries = read_window(client, key, user_id)
+        if rank is None:
+            standing["total"] = total
+            return standing
+
+        pipe = client.pipeline(transaction=False)
+        for member, _ in entries:
+            pipe.zscore(previous_key, member)
+        previous = pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to read leaderboard: {e}")
+        return standing
+
+    ids = [int(member) for member, _ in entries]
+    names = dict(get_user_model().objects.filter(pk__in=ids).values_list('pk', 'name'))
+
+    competitors = []
+    own_score = None
+    for position, ((_, score), user, before) in enumerate(zip(entries, ids, previous), start=start + 1):
+        score = int(score)
+        if user == user_id:
+            own_score = score
+        competitors.append({
+            "rank": f"#{position}",
+            "name": "You" if user == user_id else names.get(user) or "Anonymous",
+            "score": score,
+            "trend": f"{score - int(before):+d}" if before is not None else "new",
+        })
+
+    standing.update({
+        "your_rank": f"#{rank + 1}",
+        "your_score": own_score if own_score is not None else your_score,
+        "total": total,
+        "competitors": competitors,
+    })
+    return standing
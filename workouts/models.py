@@ -28,6 +28,7 @@ class WorkoutPlan(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     sessions_completed_count = models.IntegerField(default=0) 
     difficulty_level = models.IntegerField(default=1)
+    version = models.PositiveIntegerField(default=1, help_text="Bumped whenever the compiled plan payload changes.")
     
     is_active = models.BooleanField(default=True)
 
@@ -45,6 +46,42 @@ class PlanExercise(models.Model):
     class Meta:
         ordering = ['order']
 
+class WorkoutStreak(models.Model):
+    BADGE_INTERVAL = 7
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='streak')
+    timezone = models.CharField(max_length=64, default='UTC', help_text="IANA zone the user's days are counted in.")
+    current_streak = models.PositiveIntegerField(default=0)
+    longest_streak = models.PositiveIntegerField(default=0)
+    streak_started_on = models.DateField(null=True, blank=True)
+    last_active_day = models.DateField(null=True, blank=True)
+    active_days = models.PositiveIntegerField(default=0)
+    badges_earned = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.current_streak} day streak for {self.user.phone_number}"
+
+    def streak_on(self, today):
+        # Still alive until the end of the day after the last session.
+        if self.last_active_day is None or (today - self.last_active_day).days > 1:
+            return 0
+        return self.current_streak
+
+    def days_to_next_badge(self, today):
+        return self.BADGE_INTERVAL - (self.streak_on(today) % self.BADGE_INTERVAL)
+
+class DashboardSnapshot(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='dashboard_snapshot')
+    data = models.JSONField(default=dict)
+    computed_for = models.DateField(null=True, blank=True, help_text="Day the streak was computed for.")
+    is_stale = models.BooleanField(default=True)
+    generation = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Dashboard for {self.user.phone_number}"
+
 class WorkoutSession(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sessions')
     date_completed = models.DateTimeField(auto_now_add=True)
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from .models import WorkoutPlan
+from .serializers import WorkoutPlanSerializer
+
+
+def plan_cache_key(user_id):
+    return f"workout_plan:{user_id}"
+
+
+def plan_etag(plan_id, version):
+    return f'"plan-{plan_id}-v{version}"'
+
+
+def compile_plan(plan_id):
+    plan = WorkoutPlan.objects.prefetch_related('exercises__exercise').filter(pk=plan_id, is_active=True).first()
+    if plan is None:
+        return None
+
+    compiled = {
+        'plan_id': plan.pk,
+        'version': plan.version,
+        'etag': plan_etag(plan.pk, plan.version),
+        'data': WorkoutPlanSerializer(plan).data,
+    }
+    # A slower rebuild of an older version must not overwrite a newer one.
+    current = cache.get(plan_cache_key(plan.user_id))
+    if current is None or current['plan_id'] != plan.pk or current['version'] <= plan.version:
+        cache.set(plan_cache_key(plan.user_id), compiled, timeout=settings.PLAN_CACHE_TTL)
+    return compiled
+
+
+def publish_plan(plan):
+    WorkoutPlan.objects.filter(pk=plan.pk).update(version=F('version') + 1)
+    plan.refresh_from_db(fields=['version'])
+    transaction.on_commit(lambda: compile_plan(plan.pk))
+
+
+def get_compiled_plan(user):
+    compiled = cache.get(plan_cache_key(user.pk))
+    if compiled is not None:
+        return compiled
+
+    plan_id = WorkoutPlan.objects.filter(user=user, is_active=True).values_list('pk', flat=True).first()
+    if plan_id is None:
+        return None
+    return compile_plan(plan_id)
@@ -0,0 +1,88 @@
+import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import WorkoutSession, WorkoutStreak
+
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def is_valid_timezone(name):
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError, TypeError):
+        return False
+    return True
+
+
+def local_day(moment, tz_name):
+    return timezone.localtime(moment, ZoneInfo(tz_name)).date()
+
+
+def local_today(tz_name):
+    return local_day(timezone.now(), tz_name)
+
+
+def user_timezone(user):
+    tz_name = WorkoutStreak.objects.filter(user=user).values_list('timezone', flat=True).first()
+    return tz_name or settings.TIME_ZONE
+
+
+def apply_active_day(streak, day):
+    last = streak.last_active_day
+    if last is not None and day <= last:
+        # Same-day duplicates never count twice.
+        return False
+
+    if last is not None and streak.current_streak and day - last == ONE_DAY:
+        streak.current_streak += 1
+    else:
+        streak.current_streak = 1
+        streak.streak_started_on = day
+
+    streak.last_active_day = day
+    streak.active_days += 1
+    streak.longest_streak = max(streak.longest_streak, streak.current_streak)
+    if streak.current_streak % WorkoutStreak.BADGE_INTERVAL == 0:
+        streak.badges_earned += 1
+    return True
+
+
+def build_streak(user_id, tz_name=None):
+    streak = WorkoutStreak(user_id=user_id, timezone=tz_name or settings.TIME_ZONE)
+    moments = WorkoutSession.objects.filter(user_id=user_id).order_by('date_completed').values_list('date_completed', flat=True)
+    for moment in moments.iterator():
+        apply_active_day(streak, local_day(moment, streak.timezone))
+
+    if streak.last_active_day is not None and streak.streak_on(local_today(streak.timezone)) == 0:
+        streak.current_streak = 0
+    return streak
+
+
+def record_session(user, completed_at, tz_name=None):
+    with transaction.atomic():
+        streak = WorkoutStreak.objects.select_for_update().filter(user=user).first()
+        if streak is None:
+            # First session since streaks were tracked: the history already includes this one.
+            streak = build_streak(user.pk, tz_name)
+            WorkoutStreak.objects.bulk_create([streak], ignore_conflicts=True)
+            return streak
+
+        if tz_name:
+            streak.timezone = tz_name
+        if apply_active_day(streak, local_day(completed_at, streak.timezone)) or tz_name:
+            streak.save()
+    return streak
+
+
+def close_lapsed_streaks():
+    closed = 0
+    for tz_name in WorkoutStreak.objects.filter(current_streak__gt=0).values_list('timezone', flat=True).distinct():
+        cutoff = local_today(tz_name) - ONE_DAY
+        closed += WorkoutStreak.objects.filter(
+            timezone=tz_name,
+            current_streak__gt=0,
+            last_active_day__lt=cutoff
+        ).update(current_streak=0, updated_at=timezone.now())
+    return closed
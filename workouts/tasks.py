@@ -0,0 +1,20 @@
+from celery import shared_task
+from django.contrib.auth import get_user_model
+from . import streaks
+from .dashboard import refresh_dashboard
+
+User = get_user_model()
+
+
+@shared_task
+def rebuild_dashboard_snapshot(user_id):
+    user = User.objects.filter(pk=user_id).first()
+    if user is None:
+        return False
+    refresh_dashboard(user)
+    return True
+
+
+@shared_task
+def close_lapsed_streaks():
+    return streaks.close_lapsed_streaks()
@@ -1,3 +1,129 @@
+import datetime
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
 from django.test import TestCase
 
-# Create your tests here.
+from .models import WorkoutSession, WorkoutStreak
+from .streaks import close_lapsed_streaks, record_session
+
+UTC = datetime.timezone.utc
+
+
+def at(day, hour=12, minute=0):
+    return datetime.datetime(2026, 3, day, hour, minute, tzinfo=UTC)
+
+
+class StreakTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('+15550000001', name='Streaker')
+
+    def complete(self, moment, tz_name=None, user=None):
+        user = user or self.user
+        with patch('django.utils.timezone.now', return_value=moment):
+            session = WorkoutSession.objects.create(user=user)
+            return record_session(user, session.date_completed, tz_name)
+
+    def complete_days(self, first_day, count, hour=12):
+        for day in range(first_day, first_day + count):
+            self.complete(at(day, hour))
+
+    def streak(self, user=None):
+        return WorkoutStreak.objects.get(user=user or self.user)
+
+    def test_same_day_duplicates_count_once(self):
+        for hour in (0, 9, 23):
+            self.complete(at(1, hour))
+        self.complete(at(2))
+        self.complete(at(2, 18))
+
+        streak = self.streak()
+        self.assertEqual(streak.current_streak, 2)
+        self.assertEqual(streak.active_days, 2)
+        self.assertEqual(WorkoutSession.objects.filter(user=self.user).count(), 5)
+
+    def test_days_follow_the_user_timezone_across_midnight(self):
+        # 23:30 and 00:30 in Tokyo fall on the same UTC day.
+        self.complete(at(1, 14, 30), 'Asia/Tokyo')
+        self.complete(at(1, 15, 30), 'Asia/Tokyo')
+
+        streak = self.streak()
+        self.assertEqual(streak.current_streak, 2)
+        self.assertEqual(streak.streak_started_on, datetime.date(2026, 3, 1))
+        self.assertEqual(streak.last_active_day, datetime.date(2026, 3, 2))
+
+    def test_late_evening_counts_for_the_local_day_west_of_utc(self):
+        other = get_user_model().objects.create_user('+15550000002', name='Night Owl')
+        # 22:30 in New York on the 1st is already the 2nd in UTC.
+        self.complete(at(2, 3, 30), 'America/New_York', user=other)
+        self.complete(at(2, 14), 'America/New_York', user=other)
+
+        streak = self.streak(other)
+        self.assertEqual(streak.current_streak, 2)
+        self.assertEqual(streak.last_active_day, datetime.date(2026, 3, 2))
+
+    def test_streak_lapses_after_one_missed_day(self):
+        self.complete_days(1, 3)
+        streak = self.streak()
+        self.assertEqual(streak.streak_on(datetime.date(2026, 3, 4)), 3)
+        self.assertEqual(streak.streak_on(datetime.date(2026, 3, 5)), 0)
+
+        with patch('django.utils.timezone.now', return_value=at(4)):
+            self.assertEqual(close_lapsed_streaks(), 0)
+        with patch('django.utils.timezone.now', return_value=at(5)):
+            self.assertEqual(close_lapsed_streaks(), 1)
+        self.assertEqual(self.streak().current_streak, 0)
+
+        self.complete(at(5))
+        streak = self.streak()
+        self.assertEqual(streak.current_streak, 1)
+        self.assertEqual(streak.streak_started_on, datetime.date(2026, 3, 5))
+        self.assertEqual(streak.longest_streak, 3)
+        self.assertEqual(streak.active_days, 4)
+
+    def test_badges_count_every_full_interval(self):
+        self.complete_days(1, WorkoutStreak.BADGE_INTERVAL - 1)
+        self.assertEqual(self.streak().badges_earned, 0)
+
+        self.complete(at(WorkoutStreak.BADGE_INTERVAL))
+        self.complete(at(WorkoutStreak.BADGE_INTERVAL, 20))
+        streak = self.streak()
+        self.assertEqual(streak.badges_earned, 1)
+        self.assertEqual(streak.days_to_next_badge(datetime.date(2026, 3, WorkoutStreak.BADGE_INTERVAL)), 7)
+
+        self.complete_days(WorkoutStreak.BADGE_INTERVAL + 1, WorkoutStreak.BADGE_INTERVAL)
+        self.assertEqual(self.streak().badges_earned, 2)
+
+        # A broken streak starts over before the next badge.
+        self.complete_days(16, 5)
+        streak = self.streak()
+        self.assertEqual(streak.current_streak, 5)
+        self.assertEqual(streak.badges_earned, 2)
+        self.assertEqual(streak.longest_streak, 14)
+
+    def test_rebuild_verify_matches_incremental_rows(self):
+        night_owl = get_user_model().objects.create_user('+15550000003', name='Night Owl')
+        self.complete_days(1, 8)
+        self.complete(at(8, 21))
+        self.complete_days(11, 2)
+        self.complete(at(2, 3, 30), 'America/New_York', user=night_owl)
+        self.complete(at(2, 14), user=night_owl)
+        self.complete(at(4, 2), user=night_owl)
+
+        out = StringIO()
+        with patch('django.utils.timezone.now', return_value=at(13)):
+            call_command('rebuild_streaks', verify=True, stdout=out)
+        self.assertIn('All 2 streaks match history.', out.getvalue())
+
+        WorkoutStreak.objects.filter(user=self.user).update(badges_earned=5, active_days=1)
+        with patch('django.utils.timezone.now', return_value=at(13)):
+            with self.assertRaisesMessage(CommandError, '1 of 2 streaks differ from history.'):
+                call_command('rebuild_streaks', verify=True, stdout=StringIO())
+
+            call_command('rebuild_streaks', stdout=StringIO())
+            call_command('rebuild_streaks', verify=True, stdout=StringIO())
+
+        streak = self.streak()
+        self.assertEqual((streak.active_days, streak.badges_earned, streak.longest_streak), (10, 1, 8))
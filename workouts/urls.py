@@ -1,8 +1,9 @@
 from django.urls import path
-from .views import MyPlanView, CompleteSessionView, DashboardView
+from .views import MyPlanView, CompleteSessionView, DashboardView, LeaderboardView
 
 urlpatterns = [
     path('my-plan/', MyPlanView.as_view(), name='my-plan'),
     path('complete/', CompleteSessionView.as_view(), name='complete-session'),
     path('dashboard/', DashboardView.as_view(), name='dashboard'),
+    path('leaderboard/', LeaderboardView.as_view(), name='leaderboard'),
 ]
\ No newline at end of file
@@ -1,7 +1,8 @@
 from .models import WorkoutPlan, PlanExercise, Exercise
+from .plans import publish_plan
 import random
 
-def swap_exercise(plan_exercise):
+def swap_exercise(plan_exercise, publish=True):
     current_ex = plan_exercise.exercise
     plan = plan_exercise.plan
     
@@ -21,17 +22,19 @@ def swap_exercise(plan_exercise):
             plan_exercise.duration = 0
             
         plan_exercise.save()
+        if publish:
+            publish_plan(plan)
         return True
     return False
 
-def update_plan_difficulty(plan):
+def update_plan_difficulty(plan, publish=True):
     for plan_ex in plan.exercises.all():
         increased = max(0, plan.difficulty_level - 1)
         
         if plan_ex.duration and plan_ex.duration > 0:
             new_duration = plan_ex.exercise.default_duration + (increased * 5)
             if new_duration >= 60:
-                if not swap_exercise(plan_ex):
+                if not swap_exercise(plan_ex, publish=False):
                     plan_ex.duration = 60
                     plan_ex.save()
             else:
@@ -41,13 +44,16 @@ def update_plan_difficulty(plan):
         elif plan_ex.reps and plan_ex.reps > 0:
             new_reps = plan_ex.exercise.default_reps + increased
             if new_reps >= 12:
-                if not swap_exercise(plan_ex):
+                if not swap_exercise(plan_ex, publish=False):
                     plan_ex.reps = 12
                     plan_ex.save()
             else:
                 plan_ex.reps = new_reps
                 plan_ex.save()
 
+    if publish:
+        publish_plan(plan)
+
 def generate_workout_plan(user, scan_data, user_goals):
     WorkoutPlan.objects.filter(user=user).update(is_active=False)
 
@@ -120,4 +126,5 @@ def generate_workout_plan(user, scan_data, user_goals):
         )
         order_counter += 1
 
+    publish_plan(plan)
     return plan
\ No newline at end of file